@@ -0,0 +1,63 @@
+#!/usr/bin/python
+
+from .database.database import _SarosDB
+
+# this module contains code to find broken revision links of many docs at once.
+# ##############################################################################
+
+class _Breaks:
+    # represents broken revision links of docs having given names.
+    #
+    # NOTE:
+    # 1. unlike `_Document`, which checks one doc at a time in python loops,
+    #    this class checks all docs in a single vectorized pass, with numpy.
+    # 2. saros db exports "rev" & "last" of all revisions, plus a code for
+    #    each doc's name, as columns.  those are sorted by (name code, rev),
+    #    & a broken link is where a row & the row before it have the same
+    #    name code, but different "last" -- see `_Document._link_revs`.
+    # 3. numpy is needed; `_links()` throws ImportError if it is not there.
+    #    it is optional, & imported on first use only -- see `_numpy()` -- 
+    #    so that importing saros does not pay for it.
+    def __init__(self, names):
+        # `names`: names of docs to check.
+        self.__names=names
+
+    def _links(self):
+        # returns [(name, rev, prev)], sorted, for each broken link.
+        numpy=_numpy()
+        (codes, revs, lasts)=self.__columns(numpy)
+        order=numpy.lexsort((revs, codes))      # sort by code, then by rev
+        (codes, revs, lasts)=(codes[order], revs[order], lasts[order])
+        same=codes[1:] == codes[:-1]
+        broken=numpy.flatnonzero(same & (lasts[1:] != lasts[:-1])) + 1
+        return [(self.__names[codes[i]], int(revs[i]), int(revs[i]) - 1) \
+                    for i in broken]
+
+    def __columns(self, numpy):
+        # name codes, revs, & lasts of all revs in saros db, as `numpy` 
+        # arrays.
+        (codes, revs, _, lasts)=_SarosDB()._columns(self.__names)
+        return [numpy.frombuffer(col, dtype=numpy.intc) \
+                    for col in (codes, revs, lasts)]
+
+################################################################################
+
+def _numpy():
+    # returns numpy module, importing it on first call; throws ImportError 
+    # if it is not installed.
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("numpy is required to find broken links of all " + \
+                "docs at once; install it using `pip`")
+    return numpy
+
+def _has_numpy():
+    # True if numpy is installed -- e.g., to skip what needs it.
+    try:
+        _numpy()
+    except ImportError:
+        return False
+    return True
+
+################################################################################
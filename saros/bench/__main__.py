@@ -0,0 +1,7 @@
+#!/usr/bin/python
+
+from . import bench
+
+if __name__ == "__main__":
+    bench.main()
+
@@ -0,0 +1,131 @@
+#!/usr/bin/python
+
+import sys
+import json
+import argparse
+import timeit
+
+from ..saros import Saros
+from ..database.database import _SarosDB
+from ..xml import _File
+from ..store import _MemoryStore
+from ..binary import _BinaryCodec
+from .repo import _Synthetic
+
+# bench module -- times saros operations on synthetic repos of several scales.
+# ##############################################################################
+
+class _Bench:
+    # benchmarks saros operations on a synthetic repo.
+    #
+    # NOTE:
+    # 1. each operation runs on a fresh copy of the repo -- see `_Synthetic` --
+    #    so that no run sees changes made by an earlier one.
+    # 2. each result is a dict, so results are machine-readable -- e.g., as
+    #    one JSON object per line.
+    def __init__(self, synthetic, params, repeat=1):
+        # `synthetic`: `_Synthetic` repo to benchmark on.
+        # `params`: dict of repo parameters, copied into each result.
+        # `repeat`: # of runs per operation; best (i.e., min) time is reported.
+        self.__synthetic=synthetic
+        self.__params=params
+        self.__repeat=repeat
+
+    def _results(self):
+        # returns [result] -- one dict per operation timed.
+        ops=[
+                ("link_revs", self.__link_revs),
+                ("to_str", self.__to_str),
+                ("doc_dump", self.__doc_dump),
+                ("load", self.__load)
+            ]
+        return [self.__result(op, fn) for (op, fn) in ops]
+
+    def __result(self, op, fn):
+        # times `fn`, named `op`, on fresh repos; returns result dict.
+        times=[]
+        for _ in xrange(self.__repeat):
+            used=_SarosDB._use(self.__synthetic._storage())
+            try:
+                times.append(fn())
+            finally:
+                _SarosDB._use(used)
+        result=dict(self.__params)
+        result.update({"op": op, "seconds": min(times)})
+        return result
+
+    def __link_revs(self):
+        # times linking of all docs.
+        return self.__time(Saros().link_revs)
+
+    def __to_str(self):
+        # times string dump of all docs.
+        return self.__time(Saros().to_str)
+
+    def __doc_dump(self):
+        # times dump of last rev of first doc.
+        (name, rev, fname)=self.__target()
+        seconds=self.__time(lambda: _SarosDB()._doc_dump(name, rev, fname))
+        _File(fname)._remove()
+        return seconds
+
+    def __load(self):
+        # times load, with linking, of last rev of first doc.
+        (name, rev, fname)=self.__target()
+        _SarosDB()._doc_dump(name, rev, fname)
+        seconds=self.__time(lambda: _SarosDB()._load(fname))
+        _File(fname)._remove()
+        return seconds
+
+    def __target(self):
+        # returns (name, rev, fname) of doc to dump & load.
+        name=_SarosDB()._doc_names()[0]
+        rev=len(_SarosDB()._lasts(name)) - 1
+        return (name, rev, _File._unique("bench"))
+
+    def __time(self, fn):
+        # returns seconds taken by `fn()`.
+        start=timeit.default_timer()
+        fn()
+        return timeit.default_timer() - start
+
+################################################################################
+
+def _scales(text):
+    # parses scales -- "NAMESxREVS,..." -- into [(names, revs)].
+    return [tuple(int(i) for i in each.split("x")) for each in text.split(",")]
+
+def main(argv=None):
+    # runs benchmarks; writes one JSON result per line to stdout.
+    # to use: `python -m saros.bench --help`
+    parser=argparse.ArgumentParser(prog="python -m saros.bench",
+            description="benchmark saros on synthetic repos")
+    parser.add_argument("--scales", type=_scales,
+            default="10x10,100x10,100x100",
+            help="repo sizes, as NAMESxREVS,... (default: %(default)s)")
+    parser.add_argument("--breaks", type=float, default=0.1,
+            help="probability that a rev has a broken link (default: 0.1)")
+    parser.add_argument("--size", type=int, default=16,
+            help="content size, in characters (default: 16)")
+    parser.add_argument("--repeat", type=int, default=3,
+            help="runs per operation; best is reported (default: 3)")
+    parser.add_argument("--seed", type=int, default=0,
+            help="random seed (default: 0)")
+    parser.add_argument("--memory", action="store_true",
+            help="keep xml files in memory, not in temp/ on disk")
+    parser.add_argument("--binary", action="store_true",
+            help="write dump files in binary, not in xml")
+    args=parser.parse_args(argv)
+    if args.memory:
+        _File._use(_MemoryStore())
+    if args.binary:
+        _File._use_codec(_BinaryCodec())
+    for (names, revs) in args.scales:
+        params={"names": names, "revs": revs, "breaks": args.breaks,
+                "size": args.size, "memory": args.memory,
+                "binary": args.binary}
+        synthetic=_Synthetic(names, revs, args.breaks, args.size, args.seed)
+        for result in _Bench(synthetic, params, args.repeat)._results():
+            sys.stdout.write(json.dumps(result, sort_keys=True) + "\n")
+
+################################################################################
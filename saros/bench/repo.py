@@ -0,0 +1,65 @@
+#!/usr/bin/python
+
+import random
+
+from ..database.schema import _Schema
+from ..database.row import _Row
+from ..database.storage import _MemoryStorage
+
+# repo module generates synthetic saros db states (i.e., repos) for benchmarks.
+# ##############################################################################
+
+class _Synthetic:
+    # represents a synthetic saros repo, with broken revision links.
+    #
+    # NOTE:
+    # 1. repo has `names` docs, each with `revs` revisions.
+    # 2. each rev > 1 starts a new revision chain -- i.e., has a broken link,
+    #    with "prev"=0 -- with probability `breaks`; so `breaks`=0 gives a
+    #    fully linked repo.
+    # 3. within a chain, "last" is the chain's last rev, as in a real repo.
+    # 4. "content" of each rev is `size` characters long.
+    # 5. same `seed` gives the same repo, so runs can be compared.
+    def __init__(self, names, revs, breaks=0.1, size=16, seed=0):
+        self.__names=names
+        self.__revs=revs
+        self.__breaks=breaks
+        self.__size=size
+        self.__seed=seed
+
+    def _storage(self):
+        # returns a new in-memory storage holding the repo.
+        rand=random.Random(self.__seed)
+        pool=self.__pool(rand)
+        docs={}
+        for i in xrange(self.__names):
+            name="DOC" + str(i).zfill(6)
+            for row in self.__doc(name, rand, pool):
+                docs[_Schema._doc_id(name, row._get(_Schema.rev))]=row
+        return _MemoryStorage(docs)
+
+    def __doc(self, name, rand, pool):
+        # returns [_Row] -- all revisions of doc named `name`.
+        starts=[1] + [rev for rev in xrange(2, self.__revs + 1) \
+                        if rand.random() < self.__breaks]
+        ends=[rev - 1 for rev in starts[1:]] + [self.__revs]
+        rows=[]
+        for (start, last) in zip(starts, ends):
+            for rev in xrange(start, last + 1):
+                prev=0 if rev == start else rev - 1
+                content=self.__content(rand, pool)
+                rows.append(_Row(name, rev, prev, last, content))
+        return rows
+
+    def __pool(self, rand):
+        # returns random text, 2 * `size` characters long, to cut content from.
+        chars=[rand.choice("abcdefgh ") for _ in xrange(2 * self.__size)]
+        return "x" + "".join(chars) + "x"
+
+    def __content(self, rand, pool):
+        # returns doc content, `size` characters long, cut from `pool`.
+        # NOTE: content is never just digits, so it always loads back as str.
+        start=rand.randint(0, self.__size)
+        return pool[start:start + self.__size]
+
+################################################################################
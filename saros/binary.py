@@ -0,0 +1,131 @@
+#!/usr/bin/python
+
+import struct
+
+from .database.schema import _Schema
+from .database.blob import _Blob
+
+# this module contains the binary codec -- a compact, typed encoding of docs
+# for saros dump files, an alternative to xml; see `_File._use_codec()`.
+################################################################################
+
+class _BinaryCodec:
+    # represents a binary encoding of docs, each a [(name, val)].
+    #
+    # NOTE:
+    # 1. file = magic + records, one record per doc; a record is a count of
+    #    fields, & then each field:
+    #       -> name: 1 byte -- index of its `_Schema` column; or 255, & then
+    #          the name as a str, for a non-schema name
+    #       -> type: 1 byte -- 'i' (int), 's' (str), or 'r' (`_Blob`)
+    #       -> value: int as 8 bytes; str & `_Blob`'s doc id as 4-byte
+    #          length, & then bytes
+    # 2. all numbers are little-endian.
+    # 3. values keep their types, so a load needs no text parsing, nor any
+    #    guessing of ints -- e.g., content "-4" stays a str.
+    # 4. field order & count are kept as is, so a bad doc is caught by the
+    #    same schema checks as an xml one -- see `_Validator`.
+    __magic = "SAROSBIN1\n"
+    __cols = [col.name for col in _Schema]
+    __index = dict((name, i) for (i, name) in enumerate(__cols))
+    __other = 255                       # name index of a non-schema name
+    __byte = struct.Struct("<B")
+    __int = struct.Struct("<q")
+    __len = struct.Struct("<I")
+
+    def _extn(self):
+        # file extension.
+        return ".bin"
+
+    def _write(self, writer, docs, many=True):
+        # writes `docs` -- [[(name, val)]] -- to `writer`; returns # of bytes
+        # written.  `many` is ignored, as a file of one doc is just a file
+        # of many docs, holding one.
+        size=0
+        for part in self.__parts(docs):
+            writer.write(part)
+            size+=len(part)
+        return size
+
+    def _docs(self, reader, many=False):
+        # yields each doc in `reader`, as a [(name, val)].  `many` is ignored, 
+        # as a file of no docs has no records, unlike a doc of no fields.
+        if self.__read(reader, len(self.__magic)) != self.__magic:
+            raise RuntimeError("invalid binary dump: bad magic")
+        while True:
+            head=reader.read(self.__len.size)
+            if head == "":
+                return
+            if len(head) != self.__len.size:
+                raise RuntimeError("invalid binary dump: unexpected end " + \
+                        "of file")
+            (count,)=self.__len.unpack(head)
+            yield [self.__field(reader) for _ in xrange(count)]
+
+    def __parts(self, docs):
+        # yields byte strings that together make up the encoding of `docs` 
+        # -- magic, & then one per doc.
+        yield self.__magic
+        for doc in docs:
+            doc=list(doc)
+            parts=[self.__len.pack(len(doc))]
+            for (name, val) in doc:
+                parts.extend(self.__name(name) + self.__val(name, val))
+            yield "".join(parts)
+
+    def __name(self, name):
+        # encoding of field name `name`, as [bytes].
+        if name in self.__index:
+            return [self.__byte.pack(self.__index[name])]
+        return [self.__byte.pack(self.__other)] + self.__str(name)
+
+    def __val(self, name, val):
+        # encoding of value `val` of field `name`, with its type, as [bytes].
+        if isinstance(val, _Blob):
+            return ["r"] + self.__str(val._id())
+        if isinstance(val, (int, long)):
+            return ["i", self.__int.pack(val)]
+        if isinstance(val, basestring):
+            return ["s"] + self.__str(val)
+        raise TypeError("can't encode '" + name + "' value of type '" + \
+                type(val).__name__ + "'")
+
+    def __str(self, val):
+        # encoding of str `val` -- length, & then bytes -- as [bytes].
+        if isinstance(val, unicode):
+            val=val.encode("utf-8")
+        return [self.__len.pack(len(val)), val]
+
+    def __field(self, reader):
+        # reads next field; returns it as (name, val).
+        (i,)=self.__byte.unpack(self.__read(reader, 1))
+        if i == self.__other:
+            name=self.__read_str(reader)
+        elif i < len(self.__cols):
+            name=self.__cols[i]
+        else:
+            raise RuntimeError("invalid binary dump: bad name index " + str(i))
+        typ=self.__read(reader, 1)
+        if typ == "i":
+            (val,)=self.__int.unpack(self.__read(reader, self.__int.size))
+            return (name, int(val))
+        if typ == "s":
+            return (name, self.__read_str(reader))
+        if typ == "r":
+            return (name, _Blob(self.__read_str(reader)))
+        raise RuntimeError("invalid binary dump: bad type '" + typ + "'")
+
+    def __read_str(self, reader):
+        # reads next str -- length, & then bytes.
+        (size,)=self.__len.unpack(self.__read(reader, self.__len.size))
+        return self.__read(reader, size)
+
+    def __read(self, reader, size):
+        # reads exactly `size` bytes; throws if stream ends before that.
+        data=reader.read(size)
+        if len(data) != size:
+            raise RuntimeError("invalid binary dump: unexpected end " + \
+                    "of file")
+        return data
+
+################################################################################
@@ -0,0 +1,39 @@
+#!/usr/bin/python
+
+# this module contains the blob class -- a reference to a doc's content.
+# ##############################################################################
+
+class _Blob:
+    # represents `content` of a doc held out of line -- i.e., a reference to
+    # `content` of the db row with id `doc_id`, rather than a copy of it.
+    #
+    # NOTE:
+    # 1. linking changes "prev" & "last" only, yet a plain dump copies each
+    #    doc's content out of the db, & a load copies it back in.  a dump made
+    #    for linking holds a `_Blob` in place of content, so content is never
+    #    written, parsed, or rewritten on the way.
+    # 2. saros db serves as the blob store: on load, a blob of the loaded doc
+    #    itself leaves its content as is, & any other blob is read from db
+    #    just then -- i.e., content is materialized only on demand.
+    # 3. in xml, a blob is written as '<content.ref>doc_id</content.ref>' --
+    #    see `xml` module.
+    def __init__(self, doc_id):
+        # `doc_id`: id of doc whose content the blob stands for.
+        self.__id=doc_id
+
+    def _id(self):
+        # id of doc whose content the blob stands for.
+        return self.__id
+
+    def __eq__(self, other):
+        # True if `other` is a blob of the same doc.
+        return isinstance(other, _Blob) and other._id() == self.__id
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        # blob as string -- e.g., "_Blob('JE00-2')"
+        return "_Blob(" + repr(self.__id) + ")"
+
+################################################################################
@@ -0,0 +1,53 @@
+#!/usr/bin/python
+
+import threading
+from collections import OrderedDict
+
+# this module contains the query cache class of saros db.
+# ##############################################################################
+
+class _Cache:
+    # represents a cache of query results -- { key: (generation, result) } --
+    # of bounded size, evicting least recently used results first.
+    #
+    # NOTE:
+    # 1. `key` names a query & its args -- e.g., ("lasts", "JE00").
+    # 2. each result is stamped with the db generation -- a counter bumped
+    #    on each change to db -- it was computed at; a result of an older
+    #    generation is stale, & is never handed out.
+    # 3. results must not be None, & must not be changed by their users.
+    # 4. the cache is thread-safe; a lock guards its use.
+    def __init__(self, size):
+        # `size`: max # of results held.
+        self.__size=size
+        self.__results=OrderedDict()    # least recently used first
+        self.__hits=0
+        self.__misses=0
+        self.__lock=threading.Lock()
+
+    def _get(self, key, generation):
+        # returns result of `key`, if it is cached at `generation`; else None.
+        with self.__lock:
+            entry=self.__results.pop(key, None)
+            if entry is None or entry[0] != generation:
+                self.__misses+=1
+                return None
+            self.__results[key]=entry       # now most recently used
+            self.__hits+=1
+            return entry[1]
+
+    def _put(self, key, generation, result):
+        # caches `result` of `key`, computed at `generation`.
+        with self.__lock:
+            self.__results.pop(key, None)
+            self.__results[key]=(generation, result)
+            while len(self.__results) > self.__size:
+                self.__results.popitem(False)
+
+    def _stats(self):
+        # returns { "hits": n, "misses": n, "size": # of results held }
+        with self.__lock:
+            return { "hits": self.__hits, "misses": self.__misses,
+                     "size": len(self.__results) }
+
+################################################################################
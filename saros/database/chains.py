@@ -0,0 +1,88 @@
+#!/usr/bin/python
+
+import copy
+from array import array
+
+# this module contains the revision chains class -- disjoint sets of revs.
+# ##############################################################################
+
+class _Chains:
+    # represents revision chains of a doc, as disjoint sets of its revs --
+    # i.e., a union-find -- with "last" kept once per chain, at its root.
+    #
+    # NOTE:
+    # 1. revs are consecutive & start from 1 (see `_SarosDB`), so each rev is
+    #    an index into arrays below; index 0 is a filler.
+    # 2. at start, a chain is a run of consecutive revs having the same
+    #    "last".  linking rev `rev` gives all revs < `rev` the "last" of
+    #    `rev`, so chains below it are merged into its chain; chains thus
+    #    stay runs of consecutive revs, & a chain's revs < `rev` are all
+    #    found by walking down from its lowest rev.
+    # 3. `_link()` merges each chain at most once, & `_last()` finds a rev's
+    #    root w/ path compression; so both take near-constant amortized time,
+    #    rather than O(revs) row rewrites.
+    def __init__(self, lasts):
+        # `lasts`: array [0, last, ..., last] -- "last" of each rev, by rev.
+        revs=xrange(len(lasts))
+        self.__parent=list(revs)    # parent of each rev; a root is its own
+        self.__size=[1] * len(lasts)    # # of revs in chain, by root
+        self.__low=list(revs)           # lowest rev in chain, by root
+        self.__last=list(lasts)         # "last" of chain, by root
+        for rev in xrange(2, len(lasts)):
+            if lasts[rev] == lasts[rev - 1]:
+                self.__union(rev - 1, rev)
+
+    def _last(self, rev):
+        # "last" of `rev`.
+        return self.__last[self.__find(rev)]
+
+    def _lasts(self):
+        # "last" of all revs, as array('i') [0, last, ..., last].
+        lasts=array('i', [0]) * len(self.__parent)
+        for rev in xrange(1, len(lasts)):
+            lasts[rev]=self._last(rev)
+        return lasts
+
+    def _copy(self):
+        # a copy of chains, which can be linked w/o changing these chains.
+        chains=copy.copy(self)
+        chains.__parent=list(self.__parent)
+        chains.__size=list(self.__size)
+        chains.__low=list(self.__low)
+        chains.__last=list(self.__last)
+        return chains
+
+    def _link(self, rev):
+        # sets "last" of all revs < `rev` to "last" of `rev`, by merging their
+        # chains into chain of `rev`.  returns # of chains merged.
+        root=self.__find(rev)
+        last=self.__last[root]
+        merges=0
+        while self.__low[root] > 1:
+            root=self.__union(self.__low[root] - 1, root)
+            merges+=1
+        self.__last[root]=last
+        return merges
+
+    def __find(self, rev):
+        # root of chain of `rev`; makes all revs on the way point to the root.
+        parent=self.__parent
+        root=rev
+        while parent[root] != root:
+            root=parent[root]
+        while parent[rev] != root:
+            (parent[rev], rev)=(root, parent[rev])
+        return root
+
+    def __union(self, one, two):
+        # merges chains of revs `one` & `two`, smaller one under bigger one.
+        # returns root of merged chain; its "last" is that of the bigger one.
+        (one, two)=(self.__find(one), self.__find(two))
+        if self.__size[one] < self.__size[two]:
+            (one, two)=(two, one)
+        self.__parent[two]=one
+        self.__size[one]+=self.__size[two]
+        self.__low[one]=min(self.__low[one], self.__low[two])
+        return one
+
+################################################################################
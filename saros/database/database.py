@@ -1,10 +1,20 @@
 #!/usr/bin/python
 
-from collections import OrderedDict
+import threading
+import itertools
+from array import array
+from contextlib import contextmanager
 
 from ..xml import _File
 from .schema import _Schema
-from ..error import (_NoSuchDocIdError, _NoSuchColumnError,)
+from .row import _Row, _View
+from .blob import _Blob
+from .chains import _Chains
+from .cache import _Cache
+from .storage import _MemoryStorage
+from ..stats import _Stats
+from ..error import (_NoSuchDocIdError, _NoSuchColumnError,
+        _NoSnapshotError,)
 
 # this module contains the saros db class.
 # ##############################################################################
@@ -20,6 +30,9 @@ class _SarosDB:
     # 3. SarosDB then parses XML, & loads data
     # 4. After load, by default, SarosDB updates "last" of all revisions of the 
     #    doc whose revision < revision of the just updated link.
+    # 5. clients may also dump many revisions of a doc into one file, fix all 
+    #    their links, & send the file back to SarosDB to load in one go.  in 
+    #    that case, (4) is done just once, for the highest revision loaded.
     #
     # SCHEMA:
     # 1. each row represents a doc with a unique combination of "name" & "rev"
@@ -35,9 +48,10 @@ class _SarosDB:
     #    rule, so any broken revision links must be fixed thru a data update.
     #
     # DESIGN:
-    # 1. the database -- __docs (see below) -- is modeled as a class variable, 
-    #    so that all _SarosDB instances share the same data, & database updates 
-    #    from any _SarosDB instance are available to all _SarosDB instances.
+    # 1. the database -- __storage (see below) -- is modeled as a class 
+    #    variable, so that all _SarosDB instances share the same data, & 
+    #    database updates from any _SarosDB instance are available to all 
+    #    _SarosDB instances.
     # 2. to make (1) work, all methods are class methods, but you can still use 
     #    _SarosDB().method().  ref: https://pythonbasics.org/classmethod/
     # 3. saros db maintains good data, with the exception that revisions may be 
@@ -47,94 +61,386 @@ class _SarosDB:
     #    saros is through a file upload. so based on (3), the `schema` module 
     #    offers basic schema validation for file data.  and saros app fixes any 
     #    broken links.  with those 2 things, saros db should be just fine.
+    # 5. saros db logs names of docs changed by loads -- "dirty" names -- so 
+    #    that saros app can relink just those.  a name is dirty until saros 
+    #    app marks it clean after linking it.  at start, all names are dirty.
+    # 6. saros db is thread-safe.  each doc name has its own lock, & methods 
+    #    hold locks of just the names they touch, so work on different docs 
+    #    can run on threads concurrently.  a method locking > 1 name takes the 
+    #    locks in name order, so that no 2 threads deadlock.
+    # 7. rows are kept in a storage -- see `storage` module.  by default, it 
+    #    is an in-memory one, holding __docs (see below); use `_use()` to 
+    #    switch to another, such as a persistent sqlite one.
+    # 8. dumps made for linking may hold a blob -- a reference to content 
+    #    kept in db -- in place of each doc's content; see `blob` module.
+    # 9. a load's link update -- (4) above -- does not rewrite "last" of 
+    #    each upstream row; it merges the doc's revision chains instead -- 
+    #    see `chains` module.  rows of the doc then hold stale "last"s, & 
+    #    readers get "last" from its chains, until the chains are flushed 
+    #    -- i.e., written to rows, once -- when storage is switched or 
+    #    committed to disk, or a load sets a "last" directly.  a snapshot 
+    #    holds chains as they are, w/o flushing them; chains held by a 
+    #    snapshot are copied before they are next linked -- copy on write.
+    # 10. results of read queries -- `_doc_names`, `_last_revs` & `_lasts` 
+    #    -- are cached, stamped with db generation -- a counter bumped by 
+    #    each change to db; so a query is rerun only after db has changed.  
+    #    see `cache` module.  NOTE: changes made to a shared storage -- e.g., 
+    #    an sqlite file -- by other processes are not seen by the cache.
 
-    # __docs = { doc_id: [ ("name", val), ("rev", val), ("prev", val), ("last", val), ("content", val) ] }
+    # __docs = { doc_id: _Row(name, rev, prev, last, content) }
     # NOTE: the database contains broken revision links.
     __docs = { # represents the database
-        "JE00-1": [("name", "JE00"), ("rev", 1), ("prev", 0), ("last", 3), ("content", "i am JE00-1")],
-        "JE00-2": [("name", "JE00"), ("rev", 2), ("prev", 1), ("last", 3), ("content", "i am JE00-2")],
-        "JE00-3": [("name", "JE00"), ("rev", 3), ("prev", 2), ("last", 3), ("content", "i am JE00-3")],
-        "JE00-4": [("name", "JE00"), ("rev", 4), ("prev", 0), ("last", 6), ("content", "i am JE00-4")],
-        "JE00-5": [("name", "JE00"), ("rev", 5), ("prev", 4), ("last", 6), ("content", "i am JE00-5")],
-        "JE00-6": [("name", "JE00"), ("rev", 6), ("prev", 5), ("last", 6), ("content", "i am JE00-6")],
-        "JE00-7": [("name", "JE00"), ("rev", 7), ("prev", 0), ("last", 8), ("content", "i am JE00-7")],
-        "JE00-8": [("name", "JE00"), ("rev", 8), ("prev", 7), ("last", 8), ("content", "i am JE00-8")],
-        "JE01-1": [("name", "JE01"), ("rev", 1), ("prev", 0), ("last", 2), ("content", "i am JE01-1")],
-        "JE01-2": [("name", "JE01"), ("rev", 2), ("prev", 1), ("last", 2), ("content", "i am JE01-2")],
-        "JE02-1": [("name", "JE02"), ("rev", 1), ("prev", 0), ("last", 4), ("content", "i am JE02-1")],
-        "JE02-2": [("name", "JE02"), ("rev", 2), ("prev", 1), ("last", 4), ("content", "i am JE02-2")],
-        "JE02-3": [("name", "JE02"), ("rev", 3), ("prev", 2), ("last", 4), ("content", "i am JE02-3")],
-        "JE02-4": [("name", "JE02"), ("rev", 4), ("prev", 3), ("last", 4), ("content", "i am JE02-4")],
-        "JE02-5": [("name", "JE02"), ("rev", 5), ("prev", 0), ("last", 7), ("content", "i am JE02-5")],
-        "JE02-6": [("name", "JE02"), ("rev", 6), ("prev", 5), ("last", 7), ("content", "i am JE02-6")],
-        "JE02-7": [("name", "JE02"), ("rev", 7), ("prev", 6), ("last", 7), ("content", "i am JE02-7")],
-        "JE03-1": [("name", "JE03"), ("rev", 1), ("prev", 0), ("last", 1), ("content", "i am JE03-1")],
-        "JE04-1": [("name", "JE04"), ("rev", 1), ("prev", 0), ("last", 1), ("content", "i am JE04-1")],
-        "JE04-2": [("name", "JE04"), ("rev", 2), ("prev", 0), ("last", 2), ("content", "i am JE04-2")]
+        "JE00-1": _Row("JE00", 1, 0, 3, "i am JE00-1"),
+        "JE00-2": _Row("JE00", 2, 1, 3, "i am JE00-2"),
+        "JE00-3": _Row("JE00", 3, 2, 3, "i am JE00-3"),
+        "JE00-4": _Row("JE00", 4, 0, 6, "i am JE00-4"),
+        "JE00-5": _Row("JE00", 5, 4, 6, "i am JE00-5"),
+        "JE00-6": _Row("JE00", 6, 5, 6, "i am JE00-6"),
+        "JE00-7": _Row("JE00", 7, 0, 8, "i am JE00-7"),
+        "JE00-8": _Row("JE00", 8, 7, 8, "i am JE00-8"),
+        "JE01-1": _Row("JE01", 1, 0, 2, "i am JE01-1"),
+        "JE01-2": _Row("JE01", 2, 1, 2, "i am JE01-2"),
+        "JE02-1": _Row("JE02", 1, 0, 4, "i am JE02-1"),
+        "JE02-2": _Row("JE02", 2, 1, 4, "i am JE02-2"),
+        "JE02-3": _Row("JE02", 3, 2, 4, "i am JE02-3"),
+        "JE02-4": _Row("JE02", 4, 3, 4, "i am JE02-4"),
+        "JE02-5": _Row("JE02", 5, 0, 7, "i am JE02-5"),
+        "JE02-6": _Row("JE02", 6, 5, 7, "i am JE02-6"),
+        "JE02-7": _Row("JE02", 7, 6, 7, "i am JE02-7"),
+        "JE03-1": _Row("JE03", 1, 0, 1, "i am JE03-1"),
+        "JE04-1": _Row("JE04", 1, 0, 1, "i am JE04-1"),
+        "JE04-2": _Row("JE04", 2, 0, 2, "i am JE04-2")
     }
 
+    __storage = _MemoryStorage(__docs)  # storage holding rows of the db
+
+    # __dirty = set(name) -- names of docs changed since last linked.
+    # built from __storage on first use; `__put` adds to it, `_clean` removes.
+    __dirty = None
+
+    # __chains = { name: _Chains } -- chains of docs whose rows hold stale 
+    # "last"s; see DESIGN (9).
+    __chains = {}
+    __shared = set()    # names whose `__chains` are held by a snapshot, too
+
+    __generation = 0            # db generation; see DESIGN (10)
+    __cache = _Cache(1024)      # cached query results, by generation
+
+    __lock = threading.RLock()  # guards `__locks`, `__dirty`, `__chains`, 
+                                # `__shared`, `__generation`, & `__storage`
+    __locks = {}                # { name: re-entrant lock of doc `name` }
+
     @classmethod
-    def _dump(cls):
-        # dump of all docs & their `id`s, sorted by `id`
-        # returns [(doc_id, doc_data)], where doc_data=[(col_name, value)]
-        dump=[]
-        for _id in sorted(cls.__docs):
-            data=cls.__doc_data(_id)    # fix for a nasty bug
-            dump.append((_id, data))
-        return dump
+    def _dump(cls, first=None, last=None, page=1000):
+        # dump of all docs -- or, of docs with ids in [`first`, `last`] -- & 
+        # their `id`s, sorted by `id`.
+        # yields (doc_id, doc_data), where doc_data is a `_View` -- a read-only 
+        # [(col_name, value)]
+        # NOTE: 
+        # 1. a generator; ids are read from storage a page -- `page` ids -- at 
+        #    a time, so memory held does not grow with size of the db.
+        # 2. takes no locks, so a dump made while docs are being loaded may 
+        #    show some of the loaded docs & not others.
+        ids=cls.__storage._ids(first, last, page)
+        while ids:
+            for _id in ids:
+                yield (_id, cls.__doc_data(_id))
+            # smallest id after `ids[-1]` is `ids[-1]` + "\0"
+            ids=cls.__storage._ids(ids[-1] + "\0", last, page)
 
     @classmethod
     def _doc_names(cls):
         # list of all unique doc names, sorted by name
-        names=[]
-        for doc_id in cls.__docs:
-            name=cls.__fetch(doc_id, _Schema.name)
-            if name not in names:
-                names.append(name)
-        return sorted(names)
+        key=("doc_names",)
+        query=lambda: tuple(sorted(cls.__storage._names()))
+        return list(cls.__cached(key, query))
+
+    @classmethod
+    def _use(cls, storage):
+        # makes db use `storage` -- see `storage` module; returns storage used 
+        # so far.  as all docs in a new storage are unlinked for all we know, 
+        # dirty log starts afresh -- i.e., with all names dirty.
+        # NOTE: chains are flushed first, so the storage used so far is left 
+        # with no stale row.
+        cls.__flush_all()
+        with cls.__lock:
+            used=cls.__storage
+            cls.__storage=storage
+            cls.__dirty=None
+            cls.__chains={}
+            cls.__shared=set()
+        cls.__changed()
+        return used
+
+    @classmethod
+    def _dirty_names(cls):
+        # list of names of docs changed since last linked, sorted by name
+        with cls.__lock:
+            return sorted(cls.__dirty_log())
+
+    @classmethod
+    def _clean(cls, names):
+        # marks docs named `names` as linked -- i.e., removes them from the 
+        # dirty log.  callers should hold the docs' locks (see `_lock`) from 
+        # linking until now, so that no load in between goes unnoticed.
+        with cls.__lock:
+            cls.__dirty_log().difference_update(names)
 
     @classmethod
     def _last_revs(cls, name):
         # gathers "last" for all revisions of doc named `name`
         # returns an unordered [ ("rev", "last") ]
-        last_revs=[]
-        for doc_id in cls.__docs:
-            if name in doc_id:
-                rev=cls.__fetch(doc_id, _Schema.rev)
-                last=cls.__fetch(doc_id, _Schema.last)
-                last_revs.append((rev, last))
-        return last_revs
+        key=("last_revs", name)
+        return list(cls.__cached(key, lambda: cls.__last_revs(name)))
+
+    @classmethod
+    def _lasts(cls, name):
+        # gathers "last" for all revisions of doc named `name`, as a dense 
+        # array indexed by "rev" -- i.e., lasts[rev] = "last" of "rev".
+        # returns array('i') [0, last, ..., last]; lasts[0] is just a filler.
+        # NOTE: revs are consecutive & start from 1 (see SCHEMA & DESIGN), so 
+        # each rev has its own slot, & the array is filled in one pass, in any 
+        # order, w/o sorting.
+        key=("lasts", name)
+        return array('i', cls.__cached(key, lambda: cls.__lasts(name)))
+
+    @classmethod
+    def _cache_stats(cls):
+        # query cache stats, as { "hits": n, "misses": n, "size": n }
+        return cls.__cache._stats()
+
+    @classmethod
+    def _columns(cls, names):
+        # exports "rev", "prev" & "last" of all revisions of docs named `names`, 
+        # along with a code for each doc's name -- its index in `names`.
+        # returns (codes, revs, prevs, lasts) -- row-aligned array('i')s, in 
+        # no particular order.
+        cols=(array('i'), array('i'), array('i'), array('i'))
+        (codes, revs, prevs, lasts)=cols
+        with cls.__locked(names):
+            for (code, name) in enumerate(names):
+                for (rev, row) in cls.__revs(name).items():
+                    codes.append(code)
+                    revs.append(rev)
+                    prevs.append(row._get(_Schema.prev))
+                    lasts.append(cls.__last(row))
+        return cols
 
     @classmethod
     def _doc_dump(cls, name, rev, fname):
         # dumps doc named `name`, revision `rev` into file named `fname`
         # NOTE: `fname` does NOT include path & extn.
+        _Stats._count("db.dumps")
+        _Stats._count("db.rows_dumped")
+        # doc is read thru a view, not a copy, so it is written while doc's 
+        # lock is held.
         doc_id=_Schema._doc_id(name, rev)
-        data=cls.__doc_data(doc_id)    # fixed to avoid nasty bugs
-        doc=[(_Schema.id.name, doc_id)] + data
-        _File(fname)._write(doc)
+        with _Stats._timer("db.dump"):
+            with cls.__locked([name]):
+                data=cls.__doc_data(doc_id)
+                doc=itertools.chain([(_Schema.id.name, doc_id)], data)
+                _File(fname)._write(doc)
+
+    @classmethod
+    def _revs_dump(cls, name, revs, fname, refs=False):
+        # dumps revisions `revs` of doc named `name` into file named `fname`.
+        # docs are written in `revs` order, all into the same file.
+        # if `refs`, each doc's content is dumped as a `_Blob`, not a copy.
+        # NOTE: `fname` does NOT include path & extn.
+        ids=[_Schema._doc_id(name, rev) for rev in revs]
+        cls._bulk_dump(fname, ids, refs)
+
+    @classmethod
+    def _bulk_dump(cls, fname, ids=None, refs=False):
+        # dumps docs with ids `ids` -- by default, all docs, sorted by `id` -- 
+        # into file named `fname`, one <doc> record per doc, in `ids` order.
+        # if `refs`, each doc's content is dumped as a `_Blob`, not a copy.
+        # NOTE: `fname` does NOT include path & extn.
+        if ids is None:
+            ids=cls.__storage._ids()
+        _Stats._count("db.dumps")
+        _Stats._count("db.rows_dumped", len(ids))
+        with _Stats._timer("db.dump"):
+            _File(fname)._write_docs(cls.__id_docs(ids, refs))
+
+    @classmethod
+    def _name_docs(cls, names, refs=False):
+        # returns all revisions of docs named `names`, sorted by `id`, as 
+        # [[(col_name, value)]], with `id` first -- i.e., a bulk file's docs.
+        # if `refs`, each doc's content is given as a `_Blob`, not a copy.
+        ids=[]
+        with cls.__locked(names):
+            for name in names:
+                revs=cls.__revs(name)
+                ids.extend([_Schema._doc_id(name, rev) for rev in revs])
+        return cls.__id_docs(sorted(ids), refs)
+
+    @classmethod
+    def _revs_docs(cls, name, revs, refs=False):
+        # returns revisions `revs` of doc named `name`, in `revs` order, as 
+        # [[(col_name, value)]], with `id` first -- i.e., a bulk file's docs.
+        # if `refs`, each doc's content is given as a `_Blob`, not a copy.
+        ids=[_Schema._doc_id(name, rev) for rev in revs]
+        return cls.__id_docs(ids, refs)
+
+    @classmethod
+    def _bulk_load(cls, fname):
+        # loads all docs in file named `fname`, as is -- i.e., w/o linking.
+        # every doc is checked before any is loaded, so a bad record loads 
+        # nothing, & the rest are then all loaded in a single pass.
+        # NOTE: `fname` does NOT include path & extn; file may hold no docs.
+        cls.__load(fname, False, True)
 
     @classmethod
     def _load(cls, fname, link=True):
-        # loads doc data contained in file named `fname` into the database.
+        # loads data of all docs contained in file named `fname` into the db.
         # by default (i.e., `link`=True), updates `last` of upstream revs.
-        # NOTE: `fname` does NOT include path & extn.
+        # NOTE: 
+        # 1. `fname` does NOT include path & extn.
+        # 2. all docs are checked -- schema & doc id -- before any is loaded.
+        # 3. `last` is updated once per doc name, from the highest rev loaded.
+        # 4. content given as a `_Blob` is resolved from db -- see `__deref`.
+        cls.__load(fname, link, False)
+
+    @classmethod
+    def __load(cls, fname, link, many):
+        # loads docs in file named `fname` -- see `_load()`.  `many`: True if 
+        # file is a bulk one, known to hold many docs -- possibly none.
         #
-        # `doc`: doc data as an ordered dict with `_Schema` members as keys.
-        doc=_File(fname)._schema_map()
-        doc_id=doc.pop(_Schema.id)
-        cls.__put(doc_id, doc.items())      # load doc into db
+        # `docs`: [doc], where `doc` is an ord dict with `_Schema` keys.
+        with _Stats._timer("db.load"):
+            docs=_File(fname)._schema_maps(many)
+            with cls.__locked([doc[_Schema.name] for doc in docs]):
+                cls.__put_docs(docs, link)
+        _Stats._count("db.loads")
+        _Stats._count("db.rows_loaded", len(docs))
+
+    @classmethod
+    def _snapshot(cls):
+        # returns a snapshot of db's current state, for `_restore()`.
+        # no row is copied, nor written; needs a storage offering snapshots.
+        # NOTE: chains, if any, are held by the snapshot as they are, rather 
+        # than flushed to rows; so it writes no row -- see DESIGN (9).
+        if not hasattr(cls.__storage, "_snapshot"):
+            raise _NoSnapshotError(cls.__storage)
+        with cls.__lock:
+            cls.__shared=set(cls.__chains)
+            state=cls.__storage._snapshot()
+            return (cls.__storage, state, dict(cls.__chains))
+
+    @classmethod
+    def _restore(cls, snapshot):
+        # takes db back to `snapshot`, a state saved by `_snapshot()`.  as 
+        # db can't tell which docs changed since, all names become dirty.
+        (storage, state, chains)=snapshot
+        with cls.__lock:
+            storage._restore(state)
+            cls.__storage=storage
+            cls.__dirty=None
+            cls.__chains=dict(chains)
+            cls.__shared=set(chains)
+        cls.__changed()
+
+    @classmethod
+    def _lock(cls, name):
+        # returns lock of doc named `name`.  clients may hold it to make many 
+        # db calls on `name` as one unit; it is re-entrant, so db methods 
+        # called by the lock holder can take it again.
+        with cls.__lock:
+            if not cls.__locks.has_key(name):
+                cls.__locks[name]=threading.RLock()
+            return cls.__locks[name]
+
+    @classmethod
+    def _locked(cls, names):
+        # holds locks of docs named `names` for a `with` block, so that 
+        # clients can make many db calls on them as one unit -- see `_lock`.
+        return cls.__locked(names)
+
+    @classmethod
+    @contextmanager
+    def __locked(cls, names):
+        # holds locks of docs named `names`, taken in name order.
+        locks=[cls._lock(name) for name in sorted(set(names))]
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    @classmethod
+    def __put_docs(cls, docs, link):
+        # loads `docs` -- [doc], where `doc` is an ord dict with `_Schema` keys 
+        # -- into the db.  if `link` is True, updates `last` of upstream revs.
+        # all changes are committed at the end, in one go.
+        for doc in docs:
+            cls.__row(doc[_Schema.id])       # throws if no such doc id
+            if isinstance(doc[_Schema.content], _Blob):
+                cls.__row(doc[_Schema.content]._id())   # ditto, for blob
+        tops={}     # { name: highest rev loaded }
+        for doc in docs:
+            doc_id=doc.pop(_Schema.id)
+            cls.__deref(doc_id, doc)
+            cls.__put(doc_id, doc.items())      # load doc into db
+            name, rev=doc[_Schema.name], doc[_Schema.rev]
+            tops[name]=max(rev, tops.get(name, rev))
         if link:
-            cls.__update_links(doc_id)
+            for (name, rev) in tops.items():
+                cls.__update_links(_Schema._doc_id(name, rev))
+        if cls.__storage._durable():
+            for name in tops:
+                cls.__flush(name)   # rows on disk must hold right "last"s
+        cls.__storage._commit()
+
+    @classmethod
+    def __deref(cls, doc_id, doc):
+        # resolves content of `doc`, to be loaded as doc `doc_id`, if it is a 
+        # `_Blob`.  a blob of `doc_id` itself is dropped from `doc`, so that 
+        # content stays as is in db, untouched; any other blob is replaced 
+        # by the content it refers to, read from db just now.
+        blob=doc[_Schema.content]
+        if not isinstance(blob, _Blob):
+            return
+        if blob._id() == doc_id:
+            del doc[_Schema.content]
+            _Stats._count("db.blobs_kept")
+        else:
+            doc[_Schema.content]=cls.__fetch(blob._id(), _Schema.content)
+            _Stats._count("db.blobs_read")
+
+    @classmethod
+    def __id_docs(cls, ids, refs=False):
+        # returns docs with ids `ids`, in `ids` order, as [[(col_name, value)]]
+        # if `refs`, content of each doc is given as a `_Blob`, not a copy.
+        names=[cls.__fetch(doc_id, _Schema.name) for doc_id in ids]
+        docs=[]
+        with cls.__locked(names):
+            for doc_id in ids:
+                data=list(cls.__doc_data(doc_id))
+                if refs:
+                    data=cls.__blob_data(doc_id, data)
+                docs.append([(_Schema.id.name, doc_id)] + data)
+        return docs
+
+    @classmethod
+    def __blob_data(cls, doc_id, data):
+        # returns doc data `data` of `doc_id`, with content as a `_Blob`.
+        content=_Schema.content.name
+        return [(i, _Blob(doc_id) if i == content else j) for (i, j) in data]
 
     @classmethod
     def __doc_data(cls, doc_id):
-        # returns doc data, as a new list, for `doc_id`.
-        # new list reqd; otherwise, any local changes, made either by clients or 
-        # by saros, will be reflected everywhere, creating nasty bugs.
-        if not cls.__docs.has_key(doc_id):
-            raise _NoSuchDocIdError(doc_id)
-        return [item for item in cls.__docs[doc_id]]
+        # returns doc data, as a read-only view -- see `_View` -- for `doc_id`.
+        # a view, or a new list, reqd; otherwise, any local changes, made 
+        # either by clients or by saros, will be reflected everywhere, creating 
+        # nasty bugs.  a view does that w/o copying the row.
+        # NOTE: if row's "last" is stale, view shows one from chains instead.
+        row=cls.__row(doc_id)
+        if row._get(_Schema.name) in cls.__chains:
+            return _View(row, cls.__last(row))
+        return _View(row)
 
     @classmethod
     def __update_links(cls, doc_id):
@@ -145,37 +451,171 @@ class _SarosDB:
         #
         # for all revs `_rev` of doc named `name`, update links -- i.e., `last` 
         # values -- if `_rev` < `rev`.
-        last=cls.__fetch(doc_id, _Schema.last)
+        # NOTE: no row is rewritten; chains of all revs < `rev` are merged 
+        # into chain of `rev` instead -- see DESIGN (9).
         name=cls.__fetch(doc_id, _Schema.name)
         rev=cls.__fetch(doc_id, _Schema.rev)
-        for (_rev, _) in cls._last_revs(name):
-            if _rev < rev:    # fix for a nasty bug
-                _id=_Schema._doc_id(name, _rev)
-                data=[(_Schema.last, last)]
-                cls.__put(_id, data)
+        with cls.__lock:
+            chains=cls.__chains.get(name)
+            if chains is not None and name in cls.__shared:
+                chains=chains._copy()       # copy on write; see DESIGN (9)
+                cls.__chains[name]=chains
+                cls.__shared.discard(name)
+        if chains is None:
+            chains=_Chains(cls._lasts(name))
+            with cls.__lock:
+                cls.__chains[name]=chains
+        _Stats._count("db.chain_merges", chains._link(rev))
+        cls.__changed()
+
+    @classmethod
+    def __cached(cls, key, query):
+        # result of query named `key`, from cache, if cached since db last 
+        # changed; else, from running `query()`, & then cached.
+        # NOTE: result must not be changed; callers hand out copies.
+        generation=cls.__generation
+        result=cls.__cache._get(key, generation)
+        if result is not None:
+            _Stats._count("db.cache_hits")
+            return result
+        _Stats._count("db.cache_misses")
+        result=query()
+        cls.__cache._put(key, generation, result)
+        return result
+
+    @classmethod
+    def __changed(cls):
+        # bumps db generation, so that all cached results go stale.
+        # NOTE: called after a change is made, so that a result computed 
+        # while the change was made is never cached as current.
+        with cls.__lock:
+            cls.__generation+=1
+
+    @classmethod
+    def __last_revs(cls, name):
+        # see `_last_revs`; returns a tuple.
+        last_revs=[]
+        with cls.__locked([name]):
+            for rev in cls.__revs(name):
+                doc_id=_Schema._doc_id(name, rev)
+                last=cls.__fetch(doc_id, _Schema.last)
+                last_revs.append((rev, last))
+        return tuple(last_revs)
+
+    @classmethod
+    def __lasts(cls, name):
+        # see `_lasts`.
+        with cls.__locked([name]):
+            chains=cls.__chains.get(name)
+            if chains is not None:
+                return chains._lasts()
+            revs=cls.__revs(name)
+            lasts=array('i', [0]) * (len(revs) + 1)
+            for (rev, row) in revs.items():
+                lasts[rev]=row._get(_Schema.last)
+        return lasts
+
+    @classmethod
+    def __flush_all(cls):
+        # flushes chains of all docs -- see `__flush`.
+        with cls.__lock:
+            names=cls.__chains.keys()
+        with cls.__locked(names):
+            for name in names:
+                cls.__flush(name)
+
+    @classmethod
+    def __flush(cls, name):
+        # writes "last" from chains of doc named `name` to each of its rows 
+        # whose "last" is stale, & then drops the chains, as rows are now 
+        # up to date.  no-op if doc has no chains.
+        # NOTE: callers must hold the doc's lock; changes are saved, but not 
+        # committed, to storage.
+        chains=cls.__chains.get(name)
+        if chains is None:
+            return
+        for (rev, row) in cls.__revs(name).items():
+            last=chains._last(rev)
+            if row._get(_Schema.last) != last:
+                doc_id=_Schema._doc_id(name, rev)
+                row=cls.__row(doc_id, True)
+                row._set(_Schema.last, last)
+                cls.__storage._save(doc_id, row)
+                _Stats._count("db.link_rows")
+        with cls.__lock:
+            del cls.__chains[name]
+            cls.__shared.discard(name)
+
+    @classmethod
+    def __last(cls, row):
+        # "last" of `row` -- from its doc's chains, if row's "last" is stale.
+        chains=cls.__chains.get(row._get(_Schema.name))
+        if chains is None:
+            return row._get(_Schema.last)
+        return chains._last(row._get(_Schema.rev))
 
     @classmethod
     def __fetch(cls, doc_id, col):
         # given a doc_id & col (i.e., attribute), returns the value
-        doc=cls.__doc_data_dict(doc_id)
-        if doc.has_key(col.name):
-            return doc[col.name]
+        _Stats._count("db.fetches")
+        row=cls.__row(doc_id)
+        if col == _Schema.last:
+            return cls.__last(row)
+        if row._has(col):
+            return row._get(col)
         raise _NoSuchColumnError(doc_id, col)
 
     @classmethod
     def __put(cls, doc_id, data):
-        # updates data -- [(col, val)] -- of doc referred by `doc_id`
-        doc=cls.__doc_data_dict(doc_id)
+        # updates data -- [(col, val)] -- of doc referred by `doc_id`.
+        # columns are all checked before any write, so a bad column leaves the 
+        # row untouched.  doc's name is logged as dirty.
+        # NOTE: 
+        # 1. changes are saved, but not committed, to storage.
+        # 2. a "last" set other than the one from the doc's chains breaks up 
+        #    its chain, so the chains are flushed first -- see `__flush`.
+        _Stats._count("db.puts")
+        row=cls.__row(doc_id)
         for (col, val) in data:
-            if not doc.has_key(col.name):
+            if col == _Schema.last and val != cls.__last(row):
+                cls.__flush(row._get(_Schema.name))
+        row=cls.__row(doc_id, True)
+        for (col, _) in data:
+            if not row._has(col):
                 raise _NoSuchColumnError(doc_id, col)
-            doc[col.name]=val
-        cls.__docs[doc_id]=doc.items()
+        for (col, val) in data:
+            row._set(col, val)
+        cls.__storage._save(doc_id, row)
+        with cls.__lock:
+            cls.__dirty_log().add(row._get(_Schema.name))
+        cls.__changed()
 
     @classmethod
-    def __doc_data_dict(cls, doc_id):
-        # returns an ord dict of doc data, allowing easy lookup.
-        return OrderedDict(cls.__doc_data(doc_id))
+    def __revs(cls, name):
+        # returns { rev: row } of doc named `name`, from storage.
+        # NOTE: returns an empty dict if the db has no doc named `name`.
+        return cls.__storage._revs(name)
+
+    @classmethod
+    def __dirty_log(cls):
+        # returns the dirty log -- set(name) -- building it on first use.
+        # NOTE: callers must hold `__lock`.
+        if cls.__dirty is None:
+            cls.__dirty=set(cls.__storage._names())
+        return cls.__dirty
+
+    @classmethod
+    def __row(cls, doc_id, writable=False):
+        # returns the `_Row` stored for `doc_id`; if `writable`, one that may 
+        # be changed -- see `storage` module.
+        # NOTE: the row may NOT be a copy, so do NOT hand it out to clients.
+        if writable:
+            row=cls.__storage._writable(doc_id)
+        else:
+            row=cls.__storage._row(doc_id)
+        if row is None:
+            raise _NoSuchDocIdError(doc_id)
+        return row
 
 
 
@@ -0,0 +1,109 @@
+#!/usr/bin/python
+
+from .schema import _Schema
+
+# this module contains the saros db row class.
+# ##############################################################################
+
+class _Row(object):
+    # represents a row in saros db -- i.e., data of a doc, less its `id`.
+    #
+    # DESIGN:
+    # 1. a row has one slot for each `_Schema` column (except `id`, which keys 
+    #    the row in the db), laid out in schema order.
+    # 2. slots, unlike a list of tuples or a dict, give O(1) column reads & 
+    #    in-place column writes, without building any container per access.
+    # 3. `__slots__` requires a new-style class, so `_Row` derives `object`.
+    __slots__ = tuple([col.name for col in _Schema if col != _Schema.id])
+
+    def __init__(self, *vals):
+        # `vals`: column values, in schema order -- name, rev, prev, last, ...
+        for (col, val) in zip(self.__slots__, vals):
+            setattr(self, col, val)
+
+    def _has(self, col):
+        # True if `col`, a `_Schema` member, is a column of the row.
+        return col.name in self.__slots__
+
+    def _get(self, col):
+        # returns value of column `col`, a `_Schema` member.
+        return getattr(self, col.name)
+
+    def _set(self, col, val):
+        # sets value of column `col`, a `_Schema` member, to `val`.
+        setattr(self, col.name, val)
+
+    def _copy(self):
+        # returns a new row, with the same column values.
+        return _Row(*[getattr(self, col) for col in self.__slots__])
+
+    def _items(self):
+        # returns row data, as a new list, in schema order: [(col_name, val)]
+        return [(col, getattr(self, col)) for col in self.__slots__]
+
+################################################################################
+
+class _View(object):
+    # represents a read-only view of a `_Row` -- i.e., its data, as 
+    # (col_name, val) pairs, in schema order -- w/o copying the row.
+    #
+    # NOTE:
+    # 1. a view has no method to change data, so, like a copy, it keeps 
+    #    clients from changing the db by mistake; unlike a copy, it costs no 
+    #    list per read.
+    # 2. a view may, or may not -- depending on storage -- show changes made 
+    #    to the doc after the view was made; use `list(view)` to keep data 
+    #    as of now.
+    # 3. a view prints, & compares equal to lists, as `_Row._items()` would.
+    __slots__ = ("__row", "__last")
+
+    def __init__(self, row, last=None):
+        # `row`: `_Row` viewed.
+        # `last`: if not None, shown in place of row's "last" -- e.g., when 
+        #         row's own "last" is stale.
+        self.__row=row
+        self.__last=last
+
+    def __iter__(self):
+        # iterator of (col_name, val) of each column, in schema order.
+        return iter(self.__pairs())
+
+    def __len__(self):
+        return len(_Row.__slots__)
+
+    def __getitem__(self, i):
+        # (col_name, val) of `i`th column; or, if `i` is a slice, a list of 
+        # them, as for a list.
+        if isinstance(i, slice):
+            return self.__pairs()[i]
+        col=_Row.__slots__[i]
+        return (col, self.__val(col))
+
+    def __eq__(self, other):
+        # True if `other` -- a list, tuple, or view -- has the same pairs.
+        if not isinstance(other, (list, tuple, _View)):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        equal=self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None     # views are not hashable, as their rows may change
+
+    def __repr__(self):
+        # view as a list string -- e.g., "[('name', 'JE00'), ..., ]"
+        return repr(self.__pairs())
+
+    def __pairs(self):
+        # [(col_name, val)] of all columns, in schema order -- built only 
+        # when the view is iterated or printed.
+        if self.__last is None:
+            return self.__row._items()
+        return [(col, self.__val(col)) for col in _Row.__slots__]
+
+    def __val(self, col):
+        # value of column named `col`.
+        if self.__last is not None and col == _Schema.last.name:
+            return self.__last
+        return getattr(self.__row, col)
@@ -34,20 +34,23 @@ class _Schema(Enum):
         # `doc`: ord dict with `_Schema` items as keys; represents a saros doc.
         # `xml`: instance of `_Xml`.
         # throws `_FileDataError` if `doc` invalid.
-        doc_id=cls._doc_id(doc[_Schema.name], doc[_Schema.rev])
-        if not doc[_Schema.name] or doc[_Schema.name].isspace():
+        # NOTE: each value is looked up once, & doc id is built only when all 
+        # checks it depends on have passed.
+        (name, rev)=(doc[_Schema.name], doc[_Schema.rev])
+        if not name or name.isspace():
             header=xml._hdr("doc 'name' is empty or whitespace")
             raise _FileDataError(header)
-        if doc[_Schema.rev] < 1:
+        if rev < 1:
             header=xml._hdr("doc revision < 1")
             raise _FileDataError(header)
+        doc_id=cls._doc_id(name, rev)
         if doc[_Schema.id] != doc_id:
             header=xml._hdr("doc id not equal to '" + doc_id + "'")
             raise _FileDataError(header)
-        if doc[_Schema.prev] not in [0, doc[_Schema.rev] - 1]:
+        if doc[_Schema.prev] not in (0, rev - 1):
             header=xml._hdr("doc's 'prev' neither 0 nor 'rev' - 1")
             raise _FileDataError(header)
-        if doc[_Schema.last] < doc[_Schema.rev]:
+        if doc[_Schema.last] < rev:
             header=xml._hdr("doc's 'last' <  'rev'")
             raise _FileDataError(header)
 
@@ -0,0 +1,295 @@
+#!/usr/bin/python
+
+import os
+import bisect
+import sqlite3
+import threading
+
+from .schema import _Schema
+from .row import _Row
+
+# this module contains storages -- i.e., backends that hold saros db rows.
+#
+# NOTE:
+# 1. `_MemoryStorage`, the default, holds all rows in memory, as `_Row`s.
+# 2. `_SqliteStorage` holds rows in an sqlite file on disk, so that the
+#    repository outlives the process.  it opens the file only on first use, &
+#    reads rows on demand, so memory stays flat as the repository grows.
+# 3. both offer the same methods, so `_SarosDB` can use either of them:
+#       -> `_ids(first, last, limit)`
+#                               -> doc ids, sorted -- all, or up to `limit`
+#                                  of those in [`first`, `last`]
+#       -> `_names()`           -> all doc names, unordered
+#       -> `_row(doc_id)`       -> `_Row` of `doc_id`, or None if no such id
+#       -> `_revs(name)`        -> { rev: `_Row` } of doc named `name`
+#       -> `_writable(doc_id)`  -> `_Row` of `doc_id` that may be changed
+#       -> `_save(doc_id, row)` -> stores changes made to `row`
+#       -> `_add(doc_id, row)`  -> adds a new row
+#       -> `_commit()`          -> makes saved changes durable
+#       -> `_durable()`         -> True if `_commit()` writes to disk
+# 4. to change a row, get it from `_writable()`, & `_save()` it afterwards;
+#    a `_Row` from `_row()` or `_revs()` must NOT be changed.
+# 5. `_MemoryStorage` also offers O(1) snapshots -- `_snapshot()` & 
+#    `_restore()`; `_SqliteStorage` does not.
+################################################################################
+
+class _MemoryStorage:
+    # represents rows held in memory, in a stack of layers -- see `_Layer`.
+    #
+    # NOTE:
+    # 1. the top layer takes all writes; layers below it are frozen.
+    # 2. `_snapshot()` freezes the top layer, & puts a new, empty one on top; 
+    #    `_restore()` goes back to a snapshot's layers, again with a new top.  
+    #    both are O(1), as no row is copied.
+    # 3. a row in a frozen layer is never changed; `_writable()` copies it 
+    #    into top layer first -- i.e., copy-on-write.
+    # 4. a read looks up layers from top to bottom, so each snapshot taken 
+    #    adds a layer to look thru.
+    def __init__(self, docs):
+        # `docs`: { doc_id: _Row } -- rows, NOT copied, so they're changed 
+        #         in place by `_SarosDB`, until a snapshot is taken.
+        self.__frozen=()            # frozen layers, bottom first
+        self.__top=_Layer(docs)     # layer taking writes
+        self.__ids=None             # all doc ids, sorted; built on demand
+
+    def _ids(self, first=None, last=None, limit=None):
+        # doc ids, sorted -- all, or up to `limit` of those in [first, last].
+        # NOTE: sorted ids are cached, so a range is found by binary search.
+        ids=self.__sorted_ids()
+        lo=0 if first is None else bisect.bisect_left(ids, first)
+        hi=len(ids) if last is None else bisect.bisect_right(ids, last)
+        if limit is not None:
+            hi=min(hi, lo + limit)
+        return ids[lo:hi]
+
+    def _names(self):
+        # all doc names, unordered.
+        names=set()
+        for layer in self.__layers():
+            names.update(layer._names())
+        return list(names)
+
+    def _row(self, doc_id):
+        # `_Row` of `doc_id` -- NOT a copy -- or None if no such id.
+        for layer in reversed(self.__layers()):
+            row=layer._row(doc_id)
+            if row is not None:
+                return row
+        return None
+
+    def _revs(self, name):
+        # { rev: `_Row` } of doc named `name`; empty if no such name.
+        # NOTE: with no snapshot taken, returned dict is NOT a copy.
+        if not self.__frozen:
+            return self.__top._revs(name)
+        revs={}
+        for layer in self.__layers():
+            revs.update(layer._revs(name))
+        return revs
+
+    def _writable(self, doc_id):
+        # `_Row` of `doc_id` that may be changed in place, or None if no such 
+        # id.  a row in a frozen layer is first copied into top layer.
+        row=self.__top._row(doc_id)
+        if row is None:
+            row=self._row(doc_id)
+            if row is not None:
+                row=row._copy()
+                self.__top._add(doc_id, row)
+        return row
+
+    def _save(self, doc_id, row):
+        # rows are changed in place, so nothing to save.
+        pass
+
+    def _add(self, doc_id, row):
+        # adds `row` as doc `doc_id`.
+        self.__top._add(doc_id, row)
+        self.__ids=None
+
+    def _commit(self):
+        # rows live in memory only, so nothing to commit.
+        pass
+
+    def _durable(self):
+        # rows live in memory only, so they do not outlive the process.
+        return False
+
+    def _snapshot(self):
+        # freezes storage's current state; returns it, as a snapshot.
+        # NOTE: an empty top layer is left as is, rather than frozen, so that 
+        # snapshots with no writes in between add no layer.
+        if self.__top._ids():
+            self.__frozen=self.__layers()
+            self.__top=_Layer({})
+        return self.__frozen
+
+    def _restore(self, snapshot):
+        # takes storage back to `snapshot`, taken earlier by `_snapshot()`.
+        self.__frozen=snapshot
+        self.__top=_Layer({})
+        self.__ids=None
+
+    def __layers(self):
+        # all layers, bottom first.
+        return self.__frozen + (self.__top,)
+
+    def __sorted_ids(self):
+        # all doc ids, sorted, from cache; cache is built on first use.
+        if self.__ids is None:
+            ids=set()
+            for layer in self.__layers():
+                ids.update(layer._ids())
+            self.__ids=sorted(ids)
+        return self.__ids
+
+################################################################################
+
+class _Layer:
+    # represents a layer of `_MemoryStorage` -- { doc_id: _Row } -- with a 
+    # secondary index on "name", holding the same `_Row`s, so that per-name 
+    # queries touch only the rows of that name.
+    def __init__(self, docs):
+        # `docs`: { doc_id: _Row } -- rows, NOT copied.
+        self.__docs=docs
+        self.__index={}     # { name: { rev: row } }
+        for (doc_id, row) in docs.items():
+            self.__index_row(row)
+
+    def _ids(self):
+        # all doc ids in layer, unordered.
+        return self.__docs.keys()
+
+    def _names(self):
+        # all doc names in layer, unordered.
+        return self.__index.keys()
+
+    def _row(self, doc_id):
+        # `_Row` of `doc_id`, or None if layer has no such id.
+        return self.__docs.get(doc_id)
+
+    def _revs(self, name):
+        # { rev: `_Row` } of doc named `name` in layer.
+        return self.__index.get(name, {})
+
+    def _add(self, doc_id, row):
+        # adds `row` as doc `doc_id`.
+        self.__docs[doc_id]=row
+        self.__index_row(row)
+
+    def __index_row(self, row):
+        # adds `row` to name index.
+        revs=self.__index.setdefault(row._get(_Schema.name), {})
+        revs[row._get(_Schema.rev)]=row
+
+################################################################################
+
+class _SqliteStorage:
+    # represents rows held in an sqlite db file.
+    #
+    # NOTE:
+    # 1. table `docs` has one column per `_Schema` column, in schema order,
+    #    with `id` as primary key, & an index on `name`.
+    # 2. one connection per process, opened on first use; a forked process
+    #    (e.g., a `multiprocessing` worker) opens its own.
+    # 3. the connection is shared by threads, so a lock guards its use.
+    __types = { str: "TEXT", int: "INTEGER" }   # sqlite type of python type
+
+    def __init__(self, path):
+        # `path`: full name of sqlite db file; created if it doesn't exist.
+        self.__path=path
+        self.__conn=None
+        self.__pid=None
+        self.__lock=threading.RLock()
+
+    def _ids(self, first=None, last=None, limit=None):
+        # doc ids, sorted -- all, or up to `limit` of those in [first, last].
+        (where, args)=(["1"], [])
+        if first is not None:
+            (where, args)=(where + ["id >= ?"], args + [first])
+        if last is not None:
+            (where, args)=(where + ["id <= ?"], args + [last])
+        sql="SELECT id FROM docs WHERE " + " AND ".join(where) + \
+                " ORDER BY id"
+        if limit is not None:
+            (sql, args)=(sql + " LIMIT ?", args + [limit])
+        return [i for (i,) in self.__query(sql, args)]
+
+    def _names(self):
+        # all doc names, unordered.
+        return [i for (i,) in self.__query("SELECT DISTINCT name FROM docs")]
+
+    def _row(self, doc_id):
+        # new `_Row`, read from db, of `doc_id`; or None if no such id.
+        rows=self.__query(self.__select("id=?"), (doc_id,))
+        return _Row(*rows[0]) if rows else None
+
+    def _revs(self, name):
+        # { rev: `_Row` } of doc named `name`; empty if no such name.
+        revs={}
+        for vals in self.__query(self.__select("name=?"), (name,)):
+            row=_Row(*vals)
+            revs[row._get(_Schema.rev)]=row
+        return revs
+
+    def _writable(self, doc_id):
+        # new `_Row`, read from db, of `doc_id`; or None if no such id.
+        return self._row(doc_id)
+
+    def _save(self, doc_id, row):
+        # writes all columns of `row` to doc `doc_id`; `_commit()` to persist.
+        sets=", ".join([col + "=?" for (col, _) in row._items()])
+        vals=[val for (_, val) in row._items()]
+        self.__query("UPDATE docs SET " + sets + " WHERE id=?", vals+[doc_id])
+
+    def _add(self, doc_id, row):
+        # inserts `row` as doc `doc_id`; `_commit()` to persist.
+        vals=[doc_id] + [val for (_, val) in row._items()]
+        marks=", ".join(["?"] * len(vals))
+        self.__query("INSERT INTO docs VALUES (" + marks + ")", vals)
+
+    def _commit(self):
+        # commits changes made since last commit.
+        with self.__lock:
+            self.__connection().commit()
+
+    def _durable(self):
+        # rows are committed to a file on disk, so they outlive the process.
+        return True
+
+    def _copy(self, storage):
+        # adds all rows of `storage`, another storage, & commits.
+        for doc_id in storage._ids():
+            self._add(doc_id, storage._row(doc_id))
+        self._commit()
+
+    def __select(self, where):
+        # returns sql to select rows -- all columns but `id` -- that match
+        # `where`, an sql condition.
+        cols=", ".join(_Row.__slots__)
+        return "SELECT " + cols + " FROM docs WHERE " + where
+
+    def __query(self, sql, args=()):
+        # runs `sql` with `args`; returns all result rows, as [tuple].
+        with self.__lock:
+            return self.__connection().execute(sql, args).fetchall()
+
+    def __connection(self):
+        # returns connection of this process, opening it on first use.
+        if self.__pid != os.getpid():
+            self.__conn=sqlite3.connect(self.__path, timeout=30,
+                    check_same_thread=False)
+            self.__conn.text_factory=str    # `str`, not `unicode`, for TEXT
+            self.__pid=os.getpid()
+            self.__create()
+        return self.__conn
+
+    def __create(self):
+        # creates table `docs` & its index on `name`, if not there already.
+        cols=[col.name + " " + self.__types[col._type] for col in _Schema]
+        self.__conn.execute("CREATE TABLE IF NOT EXISTS docs (" + \
+                ", ".join(cols) + ", PRIMARY KEY (id))")
+        self.__conn.execute("CREATE INDEX IF NOT EXISTS docs_name " + \
+                "ON docs (name)")
+
+################################################################################
@@ -1,7 +1,9 @@
 #!/usr/bin/python
 
 from .database.database import _SarosDB
+from .database.schema import _Schema
 from .xml import _File
+from .stats import _Stats
 
 # this module contains code to link revisions of a doc having a given name.
 # ##############################################################################
@@ -18,29 +20,86 @@ class _Document:
         # 1. broken rev link is where a rev & it's prev have different `last`.
         # 2. saros revisions start from 1, so rev = 1 does not have a prev.
         # 3. therefore, skip the first rev, as it can not have a broken link.
-        # 4. so we loop from [1:], but index starts @ 0, so index -> prev item.
-        rev_chain=self.__saros_rev_chain()  # doc's `[(rev, last)]` from db
-        for i, (rev, last) in enumerate(rev_chain[1:]):
-            prev, plast=rev_chain[i]    # NOTE: `i`, not `i-1`
-            linked=last==plast
+        # 4. revs are consecutive, so a rev's prev is rev - 1.
+        # 5. all broken links are gathered first, & then fixed in one batch -- 
+        #    i.e., a single dump, edit & load -- rather than one at a time.
+        # 6. doc's db lock is held throughout, so that no other thread changes 
+        #    the doc's revisions in between the db query & the fix.
+        # 7. once linked, doc is marked clean in db -- see `_SarosDB._clean`.
+        with _SarosDB()._lock(self.__name):
+            self._link(self.__broken_links())
+
+    def _link(self, links, clean=True):
+        # links revs of `self.__name` as per `links` -- `{ rev: prev }` for 
+        # each broken link, found by `_link_revs` or elsewhere -- & then, if 
+        # `clean`, marks doc clean in db.
+        _Stats._count("document.links")
+        _Stats._count("document.breaks", len(links))
+        with _SarosDB()._lock(self.__name):
+            if links:
+                self.__dump_file(sorted(links))._link_all(links, _SarosDB())
+            if clean:
+                _SarosDB()._clean([self.__name])
+
+    def _plan(self):
+        # returns link plan of `self.__name` -- [(name, rev, prev)], sorted, 
+        # one per broken link -- w/o changing the db.
+        links=self.__broken_links()
+        return [(self.__name, rev, links[rev]) for rev in sorted(links)]
+
+    def _fixes(self):
+        # returns revs of `self.__name` having broken links, as docs -- 
+        # [[(name, val)]], with content as a `_Blob` -- each with its new 
+        # "prev"; i.e., what `_link_revs` would load, w/o changing the db.
+        with _SarosDB()._lock(self.__name):
+            links=self.__broken_links()
+            revs=sorted(links)
+            docs=_SarosDB()._revs_docs(self.__name, revs, True)
+        prev=_Schema.prev.name
+        return [[(i, links[rev]) if i == prev else (i, j) for (i, j) in doc] \
+                    for (rev, doc) in zip(revs, docs)]
+
+    def _apply(self, links):
+        # links revs of `self.__name` as per `links` -- `{ rev: prev }`, from 
+        # a plan made earlier by `_plan` or elsewhere.
+        # NOTE:
+        # 1. doc may have changed since the plan was made, so a link is fixed 
+        #    only if it is still broken, & `prev` is still `rev` - 1.
+        # 2. doc is NOT marked clean, as breaks made since the plan, if any, 
+        #    are still there.
+        with _SarosDB()._lock(self.__name):
+            now=self.__broken_links()
+            valid=dict([(rev, prev) for (rev, prev) in links.items() \
+                            if now.get(rev) == prev])
+            _Stats._count("document.stale_links", len(links) - len(valid))
+            self._link(valid, False)
+
+    def __broken_links(self):
+        # returns `{ rev: prev }` for each broken link of `self.__name`.
+        # one pass over the doc's `last`s, in `rev` order; no sort needed.
+        lasts=self.__saros_rev_chain()
+        links={}
+        for rev in xrange(2, len(lasts)):
+            linked=lasts[rev]==lasts[rev-1]
             if not linked:
-                self.__dump_file(rev)._link(prev, _SarosDB())
+                links[rev]=rev-1
+        return links
 
-    def __dump_file(self, rev):
-        # returns dump file associated with revision `rev`.
-        # dump file holds saros db dump of doc with `self.__name` & `rev`.
-        fname=self.__name+"-"+str(rev)      # file name
-        _SarosDB()._doc_dump(self.__name, rev, fname)
+    def __dump_file(self, revs):
+        # returns dump file associated with revisions `revs`.
+        # dump file holds saros db dump of docs with `self.__name` & `revs`.
+        # file name is unique to this call, so concurrent linkers never clash.
+        # linking leaves content as is, so content is dumped as blobs -- i.e., 
+        # references -- rather than copied out & back in; see `_Blob`.
+        fname=_File._unique(self.__name)
+        _SarosDB()._revs_dump(self.__name, revs, fname, True)
         return _File(fname)
 
     def __saros_rev_chain(self):
-        # Saros revision chain for doc `self.__name`, sorted by `rev`.
-        # revision chain = last_revs = [ (rev, last), .., (rev, last) ]
-
-        # NOTE: last_revs from Saros db are unordered either by `rev` or by 
-        # `last`, but this routine sorts them by `rev` in ascending order.
-        saros_rev_chain = _SarosDB()._last_revs(self.__name)
-        return sorted(saros_rev_chain, key=lambda(rev, last): rev)
+        # Saros revision chain for doc `self.__name`, indexed by `rev`.
+        # revision chain = lasts = array [0, last, .., last], where lasts[rev] 
+        # is `last` of `rev`, & lasts[0] is a filler, as revs start from 1.
+        return _SarosDB()._lasts(self.__name)
 
 
 
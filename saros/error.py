@@ -60,4 +60,15 @@ class _NoSuchColumnError(Exception):
 
 ################################################################################
 
+class _NoSnapshotError(Exception):
+    # represents error when saros db's storage does not offer snapshots.
+    def __init__(self, storage):
+        # `storage`: storage in use -- see `storage` module.
+        self.__storage=storage
 
+    def __str__(self):
+        # err msg.
+        return "storage '" + self.__storage.__class__.__name__ + "' does " + \
+                "not offer snapshots; use '_MemoryStorage' for them."
+
+################################################################################
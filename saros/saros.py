@@ -1,7 +1,14 @@
 #!/usr/bin/python
 
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
 from .database.database import _SarosDB
+from .database.schema import _Schema
 from .document import _Document
+from .analysis import _Breaks
+from .xml import _File
+from .stats import _Stats
 
 # Prem: this code, written in python, links document revisions in Saros, a
 # fictitious document repository.
@@ -82,21 +89,215 @@ class Saros:
     # (the document repository) & other private classes to link unlinked 
     # document revisions (i.e., fix broken revision links) in Saros database.
 
-    def link_revs(self):
-        # spins thru all Saros docs & links all unlinked revisions of each doc
-        for name in self.__doc_names():
+    def link_revs(self, procs=1, threads=1, dirty=False, vector=False):
+        # spins thru all Saros docs & links all unlinked revisions of each doc.
+        # `procs`: # of processes to link docs with; if > 1, see `__link_all`.
+        # `threads`: # of docs linked at a time; if > 1, see `__link_piped`.
+        # `dirty`: if True, links only docs changed since they were last 
+        #          linked -- so a rerun after a few uploads costs little.
+        # `vector`: if True, finds broken links of all docs in one vectorized 
+        #           pass, with numpy -- see `analysis` module -- & then fixes 
+        #           them; `procs` & `threads` are then ignored.
+        with _Stats._timer("saros.link_revs"):
+            self.__link_revs(procs, threads, dirty, vector)
+
+    def plan(self, dirty=False, vector=False):
+        # scans Saros docs -- all, or if `dirty`, those changed since last 
+        # linked -- for broken links, w/o changing any doc.  returns the link 
+        # plan, for `apply()`: [(name, rev, prev)], sorted, one per broken 
+        # link, where `prev` is the rev's new "prev".
+        # `vector`: if True, scans all docs in one vectorized pass -- see 
+        #           `link_revs`.
+        # NOTE: the plan holds plain strs & ints only, so it may be saved -- 
+        # e.g., as JSON -- & applied later, or split by name & applied in 
+        # parts.
+        with _Stats._timer("saros.plan"):
+            names=self.__doc_names(dirty)
+            if vector:
+                return _Breaks(names)._links()
+            return [link for name in names for link in _Document(name)._plan()]
+
+    def apply(self, plan, threads=1):
+        # fixes broken links as per `plan`, made earlier by `plan()`, in bulk 
+        # -- i.e., one dump, edit & load per doc name.
+        # `plan`: [(name, rev, prev)], in any order; lists -- e.g., from JSON 
+        #         -- do as well as tuples.
+        # `threads`: # of docs fixed at a time -- see `__link_piped`.
+        # NOTE: a doc changed since `plan` was made is fixed only where its 
+        # link is still broken as planned; & no doc is marked clean, so a 
+        # later `link_revs(dirty=True)` still finds any new breaks.
+        links={}    # { name: { rev: prev } }
+        for (name, rev, prev) in plan:
+            if isinstance(name, unicode):   # e.g., from JSON; db holds bytes
+                name=name.encode("utf-8")
+            links.setdefault(name, {})[rev]=prev
+        with _Stats._timer("saros.apply"):
+            if threads > 1:
+                self.__apply_piped(links.items(), threads)
+                return
+            for (name, each) in sorted(links.items()):
+                _Document(name)._apply(each)
+
+    def __apply_piped(self, links, threads):
+        # fixes `links` -- [(name, { rev: prev })] -- on a pool of `threads` 
+        # threads, at most `threads` docs at once.
+        pool=ThreadPool(threads)
+        try:
+            pool.map(_apply_doc, links, 1)
+        finally:
+            pool.close()
+            pool.join()
+
+    def __link_revs(self, procs, threads, dirty, vector):
+        # see `link_revs`.
+        names=self.__doc_names(dirty)
+        if vector:
+            self.__link_vector(names)
+            return
+        if procs > 1:
+            self.__link_all(names, procs)
+            return
+        if threads > 1:
+            self.__link_piped(names, threads)
+            return
+        for name in names:
             _Document(name)._link_revs()
 
+    def __link_vector(self, names):
+        # finds broken links of docs named `names` all at once, & fixes them.
+        # a doc with no broken link is still passed on, so it is marked clean.
+        links=dict([(name, {}) for name in names])  # { name: { rev: prev } }
+        for (name, rev, prev) in _Breaks(names)._links():
+            links[name][rev]=prev
+        for name in names:
+            _Document(name)._link(links[name])
+
+    def __link_piped(self, names, threads):
+        # links docs named `names` on a pool of `threads` threads, at most 
+        # `threads` docs at once.
+        # NOTE:
+        # 1. linking a doc is mostly file i/o -- dump, edit, & load -- which 
+        #    frees the GIL, so while one doc's dump is written, another's can 
+        #    be parsed & loaded; i.e., the stages pipeline across docs.
+        # 2. saros db locks each doc name, & dump files have unique names, so 
+        #    docs can safely be linked concurrently.
+        # 3. python 2 has no `asyncio`, so a thread pool does the pipelining.
+        pool=ThreadPool(threads)
+        try:
+            pool.map(_link_doc, names, 1)
+        finally:
+            pool.close()
+            pool.join()
+
+    def __link_all(self, names, procs):
+        # links docs named `names` in parallel, on `procs` worker processes.
+        # NOTE:
+        # 1. revision chains of different doc names are independent, so doc 
+        #    names are split into `procs` shards, one per worker.
+        # 2. each worker finds broken links of its shard, in its own copy of 
+        #    Saros db, & sends back only the revs to fix, each with its new 
+        #    "prev" -- see `_link_shard`.
+        # 3. fixes from all workers are then loaded into Saros db in a single 
+        #    upload, which links them -- the only way to update Saros db.  so 
+        #    the merge costs O(fixes), & revs w/o a fix are never rewritten.
+        # 4. docs may change while workers run; so the docs' locks are held 
+        #    while fixes are checked & loaded, & a fix whose link is no longer 
+        #    broken as found is dropped -- as in `apply` -- & its doc is left 
+        #    dirty.  other docs are all linked, & are marked clean.
+        if not names:
+            return      # nothing to link; no pool, nor any upload
+        shards=[names[i::procs] for i in range(procs)]
+        pool=multiprocessing.Pool(procs)
+        try:
+            fixes=pool.map(_link_shard, shards)
+        finally:
+            pool.close()
+            pool.join()
+        with _SarosDB()._locked(names):
+            fixes=[doc for each in fixes for doc in each]
+            (valid, stale)=self.__valid_fixes(fixes)
+            if valid:
+                bulk=_File(_File._unique("link-revs"))  # bulk upload file
+                bulk._write_docs(valid)
+                bulk._upload(_SarosDB())
+            _SarosDB()._clean(set(names) - stale)
+
+    def __valid_fixes(self, fixes):
+        # splits `fixes` -- docs, each [(name, val)], from `_link_shard` -- 
+        # into ones whose link is still broken as found, & names of docs 
+        # having any other.  returns (valid fixes, { name }).
+        lasts={}    # { name: lasts, from `_SarosDB._lasts` }
+        (valid, stale)=([], set())
+        for doc in fixes:
+            fix=dict(doc)
+            (name, rev)=(fix[_Schema.name.name], fix[_Schema.rev.name])
+            if name not in lasts:
+                lasts[name]=_SarosDB()._lasts(name)
+            now=lasts[name]
+            if rev < len(now) and now[rev] == fix[_Schema.last.name] and \
+                    now[rev] != now[rev - 1]:
+                valid.append(doc)
+            else:
+                stale.add(name)
+        return (valid, stale)
+
     def to_str(self):
         # string dump of all docs & their `id`s, ordered by `id`
-        val=""
-        for (_id, _doc) in _SarosDB()._dump():
-            val+=_id + ": " + str(_doc) + "\n"
-        return val.strip("\n")
+        with _Stats._timer("saros.to_str"):
+            return "\n".join([self.__line(doc) for doc in _SarosDB()._dump()])
 
-    def __doc_names(self):
-        # list of all unique doc names, sorted by name
+    def write(self, out, first=None, last=None, page=1000):
+        # streams string dump of docs -- all, or those with `id`s in [`first`, 
+        # `last`] -- ordered by `id`, to `out`, a file-like object, one line 
+        # per doc.  `page`: # of docs read from Saros db at a time.
+        for doc in _SarosDB()._dump(first, last, page):
+            out.write(self.__line(doc))
+            out.write("\n")
+
+    def __line(self, (_id, _doc)):
+        # string dump of doc `_id`, with data `_doc`.
+        return _id + ": " + str(_doc)
+
+    def instrument(self, on=True):
+        # turns on (or, if `on` is False, off) counters & timers of key events 
+        # -- dumps, parses, loads, db reads & writes, bytes written, etc. -- & 
+        # clears them.  see `stats` module.
+        _Stats._enable(on)
+
+    def stats(self):
+        # counters & timers since `instrument()`, as { "counts": { event: n }, 
+        # "seconds": { phase: total seconds } }
+        return _Stats._report()
+
+    def report(self, out):
+        # writes `stats()`, as JSON, to `out` -- a file-like object.
+        out.write(_Stats._json())
+        out.write("\n")
+
+    def __doc_names(self, dirty=False):
+        # list of all unique doc names -- or, if `dirty`, of names changed 
+        # since last linked -- sorted by name
+        if dirty:
+            return _SarosDB()._dirty_names()
         return _SarosDB()._doc_names()
 
+################################################################################
+
+def _link_doc(name):
+    # links all unlinked revisions of doc named `name`, in a pool thread.
+    _Document(name)._link_revs()
 
+def _apply_doc((name, links)):
+    # fixes links `links` -- { rev: prev } -- of doc named `name`, in a pool 
+    # thread.
+    _Document(name)._apply(links)
 
+def _link_shard(names):
+    # finds broken links of docs named `names`, in a worker process.  returns 
+    # revs to fix, as docs -- [[(name, val)]], each with its new "prev" -- for 
+    # upload into Saros db; content of each is a `_Blob`, so bodies are not 
+    # sent back & reloaded.
+    # NOTE: a module-level function, so that `multiprocessing` can pickle it.
+    return [doc for name in names for doc in _Document(name)._fixes()]
+
+################################################################################
@@ -0,0 +1,98 @@
+#!/usr/bin/python
+
+import json
+import timeit
+import threading
+
+# stats module -- counts & times key events of saros runs.
+# ##############################################################################
+
+class _Stats:
+    # represents counters & phase timers of saros runs.
+    #
+    # NOTE:
+    # 1. like `_SarosDB`, all state is in class variables, & all methods are
+    #    class methods, so all modules share the same stats.
+    # 2. stats are off by default.  when off, `_count()` returns right away,
+    #    & `_timer()` hands out an idle timer, so overhead is negligible.
+    # 3. counters -> { event: count }; timers -> { phase: total seconds }.
+    #    nested phases are each timed in full, so their times overlap.
+    # 4. stats of `multiprocessing` workers stay in the workers; only stats
+    #    of the calling process are reported.
+    __on = False
+    __counts = {}
+    __seconds = {}
+    __lock = threading.Lock()   # guards `__counts` & `__seconds`
+
+    @classmethod
+    def _enable(cls, on=True):
+        # turns stats on (or off, if `on` is False), & clears them.
+        with cls.__lock:
+            cls.__on=on
+            cls.__counts={}
+            cls.__seconds={}
+
+    @classmethod
+    def _count(cls, event, n=1):
+        # adds `n` to counter of `event`, if stats are on.
+        if not cls.__on:
+            return
+        with cls.__lock:
+            cls.__counts[event]=cls.__counts.get(event, 0) + n
+
+    @classmethod
+    def _timer(cls, phase):
+        # returns a context manager that times `phase`, if stats are on.
+        # usage: `with _Stats._timer("phase"): ...`
+        if not cls.__on:
+            return _IDLE
+        return _Timer(phase)
+
+    @classmethod
+    def _add_time(cls, phase, seconds):
+        # adds `seconds` to timer of `phase`.
+        with cls.__lock:
+            cls.__seconds[phase]=cls.__seconds.get(phase, 0.0) + seconds
+
+    @classmethod
+    def _report(cls):
+        # returns stats, as { "counts": {...}, "seconds": {...} }.
+        with cls.__lock:
+            return { "counts": dict(cls.__counts),
+                     "seconds": dict(cls.__seconds) }
+
+    @classmethod
+    def _json(cls):
+        # returns stats as a JSON string, with sorted keys.
+        return json.dumps(cls._report(), sort_keys=True, indent=2)
+
+################################################################################
+
+class _Timer:
+    # times a phase, from `__enter__` to `__exit__`, into `_Stats`.
+    def __init__(self, phase):
+        self.__phase=phase
+        self.__start=None
+
+    def __enter__(self):
+        self.__start=timeit.default_timer()
+        return self
+
+    def __exit__(self, *exc):
+        # `exc`: exception info, if any; exceptions are NOT suppressed.
+        _Stats._add_time(self.__phase, timeit.default_timer() - self.__start)
+        return False
+
+################################################################################
+
+class _Idle:
+    # a timer that times nothing -- used when stats are off.
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_IDLE = _Idle()     # the one idle timer
+
+################################################################################
@@ -0,0 +1,218 @@
+#!/usr/bin/python
+
+import os
+import io
+import bz2
+import gzip
+import errno
+from contextlib import contextmanager
+
+# this module contains stores -- i.e., backends that hold the bytes of saros 
+# xml files.  a store hands out file-like readers & writers for a file name.
+#
+# NOTE:
+# 1. `_DiskStore`, the default, keeps files under saros `temp` directory.
+# 2. `_MemoryStore` keeps files in memory, as byte strings, so that the dump -> 
+#    edit -> load protocol runs without any disk i/o.  useful for local runs & 
+#    unit tests.
+# 3. `_CompressedStore` keeps files in another store -- disk or memory -- 
+#    compressed, with gzip or bz2; files are compressed & decompressed as 
+#    they are written & read, a chunk at a time.
+# 4. all offer the same methods, so `_File` can use any of them:
+#       -> `_reader(name)`      -> reader of file `name`, for a `with` block
+#       -> `_writer(name)`      -> writer of file `name`, for a `with` block
+#       -> `_remove(name)`      -> removes file `name`, if it is there
+#       -> `_full_name(name)`   -> full name of file `name`, for messages
+################################################################################
+
+class _DiskStore:
+    # represents files in a directory on disk.
+    def __init__(self, _dir="temp"):
+        # `_dir`: directory, relative to saros package, holding the files
+        self.__dir=_dir
+
+    def _reader(self, name):
+        # returns a reader for file `name` (name includes extn, not path)
+        return open(self._full_name(name), 'rb')
+
+    def _writer(self, name):
+        # returns a writer for file `name` (name includes extn, not path)
+        return open(self._full_name(name), 'wb')
+
+    def _remove(self, name):
+        # removes file `name`, if it exists.
+        if os.path.exists(self._full_name(name)):
+            os.remove(self._full_name(name))
+
+    def _full_name(self, name):
+        # returns full name of file: full path + file name + extension
+        # example: '~/../saros/saros/temp/doc.xml'
+        return self.__path() + name
+
+    def __path(self):
+        # returns full path to the directory.
+        # example: '~/../saros/saros/temp/'
+        return os.path.dirname(os.path.realpath(__file__)) + \
+                "/" + self.__dir + "/"
+
+################################################################################
+
+class _MemoryStore:
+    # represents files held in memory -- { name: bytes }.
+    def __init__(self):
+        self.__files={}
+
+    def _reader(self, name):
+        # returns a reader for file `name`; throws IOError if no such file.
+        if not self.__files.has_key(name):
+            raise IOError(errno.ENOENT, "no such file", self._full_name(name))
+        return io.BytesIO(self.__files[name])
+
+    def _writer(self, name):
+        # returns a writer for file `name`; file is saved when writer closes.
+        return _Buffer(self.__files, name)
+
+    def _remove(self, name):
+        # removes file `name`, if it exists.
+        self.__files.pop(name, None)
+
+    def _names(self):
+        # returns names of all files in store, sorted.
+        return sorted(self.__files)
+
+    def _full_name(self, name):
+        # returns full name of file, as used in messages.
+        return "memory:" + name
+
+################################################################################
+
+class _Buffer(io.BytesIO):
+    # represents a writer for a file in `_MemoryStore`.
+    def __init__(self, files, name):
+        # `files`: `_MemoryStore` files -- { name: bytes }
+        # `name`: name of file being written
+        io.BytesIO.__init__(self)
+        self.__files=files
+        self.__name=name
+
+    def close(self):
+        # saves written bytes into `files`, & then closes the buffer.
+        if not self.closed:
+            self.__files[self.__name]=self.getvalue()
+        io.BytesIO.close(self)
+
+################################################################################
+
+class _CompressedStore:
+    # represents files held compressed in another store -- e.g., file 
+    # 'doc.xml' is held there as 'doc.xml.gz'.
+    #
+    # NOTE:
+    # 1. `kind` -- the extension -- picks the compression: "gz" (gzip) or 
+    #    "bz2" (bzip2).  python 2 has no lzma in its stdlib.
+    # 2. readers decompress a chunk at a time, as they are read from, so a 
+    #    file is never inflated in full in memory; writers likewise.
+    __kinds = ("gz", "bz2")
+
+    def __init__(self, store, kind="gz"):
+        # `store`: store holding the compressed files -- e.g., `_DiskStore`.
+        # `kind`: compression -- "gz" or "bz2".
+        if kind not in self.__kinds:
+            raise ValueError("unknown compression '" + kind + "'; use " + \
+                    "one of: " + ", ".join(self.__kinds))
+        self.__store=store
+        self.__kind=kind
+
+    @contextmanager
+    def _reader(self, name):
+        # returns a reader for file `name`, decompressing as it is read.
+        with self.__store._reader(self.__zname(name)) as raw:
+            if self.__kind == "gz":
+                reader=gzip.GzipFile(fileobj=raw, mode="rb")
+            else:
+                reader=_Bz2Reader(raw)
+            try:
+                yield reader
+            finally:
+                reader.close()
+
+    @contextmanager
+    def _writer(self, name):
+        # returns a writer for file `name`, compressing as it is written.
+        with self.__store._writer(self.__zname(name)) as raw:
+            if self.__kind == "gz":
+                writer=gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6)
+            else:
+                writer=_Bz2Writer(raw)
+            try:
+                yield writer
+            finally:
+                writer.close()      # writes the end of compressed stream
+
+    def _remove(self, name):
+        # removes file `name`, if it exists.
+        self.__store._remove(self.__zname(name))
+
+    def _full_name(self, name):
+        # returns full name of file, as held in the other store.
+        return self.__store._full_name(self.__zname(name))
+
+    def __zname(self, name):
+        # name of file `name` in the other store -- e.g., 'doc.xml.gz'
+        return name + "." + self.__kind
+
+################################################################################
+
+class _Bz2Writer:
+    # represents a writer that compresses, with bzip2, into `raw` writer.
+    # NOTE: python 2's `bz2.BZ2File` takes file names only, not file objects.
+    def __init__(self, raw):
+        self.__raw=raw
+        self.__zip=bz2.BZ2Compressor()
+
+    def write(self, data):
+        # compresses `data`; writes what is ready of it to `raw`.
+        self.__raw.write(self.__zip.compress(data))
+
+    def close(self):
+        # writes the rest -- i.e., the end -- of compressed stream to `raw`.
+        # NOTE: `raw` is NOT closed.
+        self.__raw.write(self.__zip.flush())
+
+################################################################################
+
+class _Bz2Reader:
+    # represents a reader that decompresses, with bzip2, from `raw` reader.
+    def __init__(self, raw, size=65536):
+        # `raw`: reader of compressed bytes.
+        # `size`: # of compressed bytes read from `raw` at a time.
+        self.__raw=raw
+        self.__size=size
+        self.__zip=bz2.BZ2Decompressor()
+        self.__buf=""       # decompressed, but not yet read
+        self.__end=False    # True at end of `raw`
+
+    def read(self, size=-1):
+        # returns up to `size` decompressed bytes -- all of them, if `size` 
+        # < 0; returns "" at end of stream.
+        parts=[self.__buf]
+        have=len(self.__buf)
+        while (size < 0 or have < size) and not self.__end:
+            chunk=self.__raw.read(self.__size)
+            if chunk == "" or self.__zip.unused_data:
+                self.__end=True
+                break
+            part=self.__zip.decompress(chunk)
+            parts.append(part)
+            have+=len(part)
+        data="".join(parts)
+        if size < 0:
+            size=len(data)
+        self.__buf=data[size:]
+        return data[:size]
+
+    def close(self):
+        # NOTE: `raw` is NOT closed.
+        pass
+
+################################################################################
@@ -1,12 +1,29 @@
 #!/usr/bin/python
 
+import io
+import json
+import os
 import unittest
+import tempfile
+import threading
+from array import array
 
 from ..saros import Saros
+from ..document import _Document
+from .. import analysis
 from ..database.database import _SarosDB, _Schema
+from ..database.storage import _SqliteStorage, _MemoryStorage
+from ..database.row import _Row
+from ..database.blob import _Blob
+from ..database.chains import _Chains
+from ..database.cache import _Cache
 from ..xml import _File
-from ..error import _FileSchemaError, _FileDataError, _NoSuchDocIdError
+from ..store import _MemoryStore, _CompressedStore
+from ..binary import _BinaryCodec
+from ..error import (_FileSchemaError, _FileDataError, _NoSuchDocIdError,
+        _NoSnapshotError)
 from . import repo
+from ..bench.repo import _Synthetic
 
 # test module -- contains all unit tests for saros application.
 # ##############################################################################
@@ -15,13 +32,13 @@ class Test(unittest.TestCase):
     # tests linking of broken revision chains in Saros
     def setUp(self):
         self._saros=Saros()
-        self._docs=_SarosDB()._dump()
-        self._fname="test"   # file name
+        self._snap=_SarosDB()._snapshot()
+        self._fname=_File._unique("test")   # file name
 
     def tearDown(self):
         self._reset()
         self._saros=None
-        self_docs=None
+        self._snap=None
         self._fname=None
 
     def runTest(self):
@@ -51,21 +68,23 @@ class Test(unittest.TestCase):
     def _assert(self):
         # assert expected result
         self._print("BEFORE")
-        self._saros.link_revs()
+        self._link()
         self._print("AFTER")
         self.assertEqual(self._saros.to_str(), repo._expected())
 
+    def _link(self):
+        # link revisions in saros db
+        self._saros.link_revs()
+
     def _print(self, _str=""):
         # formats & prints saros db state as a string.
         print("SAROS REPOSITORY STATE " +  _str + ": \n" + \
                 self._saros.to_str() + "\n")
 
     def _reset(self):
-        # reset saros db to its original state
-        for (_id, doc) in self._docs:
-            doc=[(_Schema.id.name, _id)] + doc
-            _File(self._fname)._write(doc)
-            self._load()
+        # reset saros db to its original state, & remove test file
+        _SarosDB()._restore(self._snap)
+        _File(self._fname)._remove()
 
     def _load(self):
         # load doc data in file to saros db, without linking
@@ -208,6 +227,25 @@ class TestSizeMismatch(TestFileLoad):
         msg="non-schema columns 'useless-me, silly-me'"
         self._assert_with(_FileSchemaError, msg)
 
+class TestRepeatedRogues(TestFileLoad):
+    # non-schema columns are listed in order of occurence, repeats included.
+    def _doc(self):
+        return [
+                (_Schema.id.name, "JE00-2"),
+                ("useless-me", "problem!"),
+                (_Schema.name.name, "JE00"),
+                ("silly-me", "problem!"),
+                (_Schema.rev.name, 2),
+                ("useless-me", "problem!"),
+                (_Schema.prev.name, 1),
+                (_Schema.last.name, 3),
+                (_Schema.content.name, "i am JE00-2")
+            ]
+
+    def _assert(self):
+        msg="non-schema columns 'useless-me, silly-me, useless-me'"
+        self._assert_with(_FileSchemaError, msg)
+
 ##############################################################################
 
 class TestBadName(TestFileLoad):
@@ -305,6 +343,25 @@ class TestReverseFieldOrder(TestFileLoad):
 
 ##############################################################################
 
+class TestMultiLineContent(TestFileLoad):
+    def _doc(self):
+        return [
+                (_Schema.id.name, "JE00-4"),
+                (_Schema.name.name, "JE00"),
+                (_Schema.rev.name, 4),
+                (_Schema.prev.name, 0),
+                (_Schema.last.name, 6),
+                (_Schema.content.name, "i am\n  JE00-4\n")
+            ]
+
+    def _assert(self):
+        self._load()
+        self._print()
+        docs=dict(_SarosDB()._dump())
+        self.assertEqual(docs["JE00-4"], self._doc()[1:])
+
+##############################################################################
+
 class TestNoSuchId(TestFileLoad):
     def _doc(self):
         return [
@@ -323,6 +380,372 @@ class TestNoSuchId(TestFileLoad):
 
 ##############################################################################
 
+class TestLastRevs(Test):
+    # `_last_revs` & `_lasts` must return revs of the named doc only.
+    def _assert(self):
+        db=_SarosDB()
+        self.assertEqual(db._last_revs("JE0"), [])
+        self.assertEqual(sorted(db._last_revs("JE04")), [(1, 1), (2, 2)])
+        lasts=[0, 3, 3, 3, 6, 6, 6, 8, 8]
+        self.assertEqual(db._lasts("JE00").tolist(), lasts)
+        self.assertEqual(db._lasts("JE0").tolist(), [0])
+        names=["JE00", "JE01", "JE02", "JE03", "JE04"]
+        self.assertEqual(db._doc_names(), names)
+
+class TestBatchLink(Test):
+    # all broken links of a doc get fixed in one dump & load.
+    def _assert(self):
+        db=_SarosDB()
+        db._revs_dump("JE00", [4, 7], self._fname)
+        _File(self._fname)._link_all({4: 3, 7: 6}, db)
+        self._print("AFTER")
+        lines=self._saros.to_str().split("\n")
+        self.assertEqual(lines[:8], repo._expected().split("\n")[:8])
+        self.assertEqual(lines[8:], repo._orig().split("\n")[8:])
+
+class TestContentRefs(Test):
+    # link dumps hold content as blobs; a load resolves blobs from the db.
+    def _assert(self):
+        db=_SarosDB()
+        db._revs_dump("JE00", [4, 7], self._fname, True)
+        docs=_File(self._fname)._parse_docs()
+        self.assertIn(("content.ref", "JE00-4"), docs[0])
+        self.assertNotIn("content", dict(docs[0]))
+        _File(self._fname)._link_all({4: 3, 7: 6}, db)
+        lines=self._saros.to_str().split("\n")
+        self.assertEqual(lines[:8], repo._expected().split("\n")[:8])
+        doc=[(i, _Blob("JE01-1") if i == "content" else j) \
+                for (i, j) in db._name_docs(["JE04"])[0]]
+        _File(self._fname)._write_docs([doc])
+        db._bulk_load(self._fname)
+        self.assertEqual(dict(list(db._dump("JE04-1"))[0][1])["content"],
+                "i am JE01-1")
+        doc[-1]=("content", _Blob("JE09-1"))
+        _File(self._fname)._write_docs([doc])
+        with self.assertRaises(_NoSuchDocIdError):
+            db._bulk_load(self._fname)
+
+class TestParallelLink(Test):
+    # linking across a pool of processes gives the same result as serial, & 
+    # loads just the revs fixed.
+    def _link(self):
+        self._saros.instrument()
+        try:
+            self._saros.link_revs(3)
+            counts=self._saros.stats()["counts"]
+        finally:
+            self._saros.instrument(False)
+        self.assertEqual(counts["db.rows_loaded"], 4)
+        self.assertEqual(_SarosDB()._dirty_names(), [])
+
+@unittest.skipIf(not analysis._has_numpy(), "numpy not installed")
+class TestVectorLink(Test):
+    # finding broken links of all docs at once, with numpy, gives the same 
+    # result as finding them one doc at a time.
+    def _link(self):
+        names=_SarosDB()._doc_names()
+        links=[("JE00", 4, 3), ("JE00", 7, 6), ("JE02", 5, 4), ("JE04", 2, 1)]
+        self.assertEqual(analysis._Breaks(names)._links(), links)
+        self._saros.link_revs(vector=True)
+
+class TestPipelinedLink(Test):
+    # linking on a pool of threads gives the same result as serial.
+    def _link(self):
+        self._saros.link_revs(threads=4)
+
+class TestThreadedLink(Test):
+    # docs linked on many threads at once -- a few of them linking the same 
+    # doc -- give the same result as serial linking.
+    def _link(self):
+        names=_SarosDB()._doc_names() * 2
+        threads=[threading.Thread(target=self.__link, args=(name,)) \
+                    for name in names]
+        for each in threads:
+            each.start()
+        for each in threads:
+            each.join()
+
+    def __link(self, name):
+        _Document(name)._link_revs()
+
+class TestDirtyLink(Test):
+    # only docs changed since last linked get relinked.
+    def _link(self):
+        db=_SarosDB()
+        self.assertEqual(db._dirty_names(), db._doc_names())
+        self._saros.link_revs()
+        self.assertEqual(db._dirty_names(), [])
+        doc=[("id", "JE04-1"), ("name", "JE04"), ("rev", 1), ("prev", 0), 
+                ("last", 1), ("content", "i am JE04-1")]
+        _File(self._fname)._write(doc)
+        self._load()        # breaks JE04's chain
+        self.assertEqual(db._dirty_names(), ["JE04"])
+        self._saros.link_revs(dirty=True)
+        self.assertEqual(db._dirty_names(), [])
+        self._saros.link_revs(procs=2, dirty=True)    # none dirty
+        self.assertEqual(db._dirty_names(), [])
+
+class TestRowView(Test):
+    # a dumped doc's view reads like the list it stands for.
+    def _assert(self):
+        view=list(_SarosDB()._dump("JE04-1"))[0][1]
+        data=list(view)
+        self.assertEqual(view, data)
+        self.assertEqual(view[1], data[1])
+        self.assertEqual(view[-1], data[-1])
+        self.assertEqual(view[1:], data[1:])
+        self.assertEqual(view[::2], data[::2])
+
+class TestChains(Test):
+    # "last"s read thru revision chains match rows rewritten one by one,
+    # before & after chains are flushed to rows.
+    def _link(self):
+        chains=_Chains(array('i', [0, 2, 2, 5, 5, 5, 6, 9, 9, 9]))
+        self.assertEqual(chains._link(4), 1)
+        self.assertEqual(chains._lasts().tolist(), [0,5,5,5,5,5,6,9,9,9])
+        self.assertEqual(chains._link(8), 2)
+        self.assertEqual(chains._lasts().tolist(), [0,9,9,9,9,9,9,9,9,9])
+        db=_SarosDB()
+        self._saros.link_revs()
+        doc=[("id", "JE00-2"), ("name", "JE00"), ("rev", 2), ("prev", 1),
+                ("last", 5), ("content", "i am JE00-2")]
+        _File(self._fname)._write(doc)
+        self._load()        # sets a "last" directly, so chains get flushed
+        lasts=[0, 8, 5, 8, 8, 8, 8, 8, 8]
+        self.assertEqual(db._lasts("JE00").tolist(), lasts)
+        self.assertIn((2, 5), db._last_revs("JE00"))
+        doc[4]=("last", 8)
+        _File(self._fname)._write(doc)
+        self._load()
+
+class TestQueryCache(Test):
+    # repeated queries are served from cache, until db changes; least 
+    # recently used results are evicted first.
+    def _link(self):
+        db=_SarosDB()
+        names=db._doc_names()
+        hits=db._cache_stats()["hits"]
+        self.assertEqual(db._doc_names(), names)
+        self.assertEqual(db._lasts("JE00").tolist(), [0,3,3,3,6,6,6,8,8])
+        db._lasts("JE00").append(9)     # a copy; cache is left as is
+        self.assertEqual(db._cache_stats()["hits"], hits + 2)
+        Test._link(self)
+        self.assertEqual(db._lasts("JE00").tolist(), [0] + [8] * 8)
+        cache=_Cache(2)
+        for key in ["a", "b", "a", "c"]:
+            cache._put(key, 0, key.upper())
+        self.assertEqual((cache._get("a", 0), cache._get("b", 0)), ("A", None))
+        self.assertEqual(cache._get("c", 1), None)      # stale generation
+        self.assertEqual(cache._stats(), {"hits": 1, "misses": 2, "size": 1})
+
+class TestPlanApply(Test):
+    # a plan, made w/o changing the db, & applied later -- even after a trip
+    # thru JSON -- gives the same result as linking; a stale plan is a no-op.
+    def _link(self):
+        db=_SarosDB()
+        plan=self._saros.plan()
+        links=[("JE00", 4, 3), ("JE00", 7, 6), ("JE02", 5, 4), ("JE04", 2, 1)]
+        self.assertEqual(plan, links)
+        self.assertEqual(self._saros.to_str(), repo._orig())
+        if analysis._has_numpy():
+            self.assertEqual(self._saros.plan(vector=True), links)
+        used=_File._use(_MemoryStore())     # JSON names are unicode
+        try:
+            self._saros.apply(json.loads(json.dumps(plan)), 2)
+        finally:
+            _File._use(used)
+        self.assertEqual(db._dirty_names(), db._doc_names())
+        self.assertEqual(self._saros.plan(), [])
+        self._saros.apply(plan)
+        name="D\xc3\xa9"       # non-ascii name, as utf-8 bytes
+        used=(_SarosDB._use(_MemoryStorage({
+                name + "-1": _Row(name, 1, 0, 1, "i am " + name + "-1"),
+                name + "-2": _Row(name, 2, 0, 2, "i am " + name + "-2")})),
+              _File._use(_MemoryStore()))
+        try:
+            plan=self._saros.plan()
+            self.assertEqual(plan, [(name, 2, 1)])
+            self._saros.apply(json.loads(json.dumps(plan)))
+            self.assertEqual(db._lasts(name).tolist(), [0, 2, 2])
+        finally:
+            _SarosDB._use(used[0])
+            _File._use(used[1])
+
+class TestSqliteStorage(Test):
+    # linking works the same on a persistent sqlite storage, & linked docs 
+    # are there when the storage is opened afresh.
+    def _assert(self):
+        (fd, path)=tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        storage=_SqliteStorage(path)
+        used=_SarosDB._use(storage)
+        try:
+            storage._copy(used)
+            Test._assert(self)
+            _SarosDB._use(_SqliteStorage(path))     # cold start
+            self.assertEqual(self._saros.to_str(), repo._expected())
+            with self.assertRaises(_NoSnapshotError):
+                _SarosDB()._snapshot()
+        finally:
+            _SarosDB._use(used)
+            os.remove(path)
+
+class TestSnapshot(Test):
+    # db can go back & forth between snapshots; a snapshot writes no row, & 
+    # keeps its revision chains as they were, however db is linked later.
+    def _assert(self):
+        db=_SarosDB()
+        doc=[("id", "JE00-4"), ("name", "JE00"), ("rev", 4), ("prev", 3),
+                ("last", 6), ("content", "i am JE00-4")]
+        _File(self._fname)._write(doc)
+        db._load(self._fname)       # links JE00's revs 1 - 4, thru chains
+        self._saros.instrument()
+        try:
+            half=db._snapshot()
+            counts=self._saros.stats()["counts"]
+        finally:
+            self._saros.instrument(False)
+        self.assertFalse("db.link_rows" in counts)
+        Test._assert(self)
+        linked=db._snapshot()
+        db._restore(half)
+        self.assertEqual(db._lasts("JE00").tolist(), [0,6,6,6,6,6,6,8,8])
+        db._restore(self._snap)
+        self.assertEqual(self._saros.to_str(), repo._orig())
+        db._restore(linked)
+        self.assertEqual(self._saros.to_str(), repo._expected())
+
+class TestSynthetic(Test):
+    # every chain of a synthetic repo gets linked.
+    def _assert(self):
+        used=_SarosDB._use(_Synthetic(20, 30, 0.2)._storage())
+        try:
+            db=_SarosDB()
+            self.assertEqual(len(list(db._dump())), 20 * 30)
+            self._saros.link_revs()
+            for name in db._doc_names():
+                self.assertEqual(db._lasts(name).tolist(), [0] + [30] * 30)
+        finally:
+            _SarosDB._use(used)
+
+class TestStats(Test):
+    # counters & timers of a link run.
+    def _link(self):
+        self._saros.instrument()
+        try:
+            Test._link(self)
+            stats=self._saros.stats()
+        finally:
+            self._saros.instrument(False)
+        counts=stats["counts"]
+        self.assertEqual(counts["document.links"], 5)
+        self.assertEqual(counts["document.breaks"], 4)
+        self.assertEqual(counts["db.loads"], 3)
+        self.assertEqual(counts["db.rows_loaded"], 4)
+        self.assertEqual(counts["db.chain_merges"], 4)
+        self.assertFalse("db.link_rows" in counts)     # no row rewritten
+        self.assertTrue(counts["file.bytes_written"] > 0)
+        self.assertTrue("saros.link_revs" in stats["seconds"])
+        self.assertEqual(self._saros.stats(), {"counts": {}, "seconds": {}})
+
+class TestWrite(Test):
+    # streamed dump, in pages & id ranges, matches string dump.
+    def _assert(self):
+        out=io.BytesIO()
+        self._saros.write(out, page=3)
+        self.assertEqual(out.getvalue(), repo._orig() + "\n")
+        out=io.BytesIO()
+        self._saros.write(out, "JE01", "JE02-2", 1)
+        lines=repo._orig().split("\n")[8:12]
+        self.assertEqual(out.getvalue(), "\n".join(lines) + "\n")
+
+class TestMemoryStore(Test):
+    # linking works the same, with xml files held in memory, not on disk.
+    def _assert(self):
+        store=_MemoryStore()
+        used=_File._use(store)
+        try:
+            _File(self._fname)._write([])
+            self.assertEqual(store._names(), [self._fname + ".xml"])
+            _File(self._fname)._remove()
+            Test._assert(self)
+            self.assertEqual(store._names(), [])    # scratch files removed
+        finally:
+            _File._use(used)
+
+class TestBinaryCodec(Test):
+    # linking works the same with binary dump files; values keep their types,
+    # & bad docs fail the same schema checks as xml ones.
+    def _assert(self):
+        store=_MemoryStore()
+        used=(_File._use(store), _File._use_codec(_BinaryCodec()))
+        try:
+            Test._assert(self)
+            doc=[("id", "JE04-1"), ("name", "JE04"), ("rev", 1),
+                    ("prev", 0), ("last", 2), ("content", "-4"), ("x", 1)]
+            _File(self._fname)._write(doc)
+            self.assertEqual(store._names(), [self._fname + ".bin"])
+            self.assertEqual(_File(self._fname)._parse_docs(), [doc])
+            with self.assertRaises(_FileSchemaError):
+                self._load()
+            _File(self._fname)._write_docs([doc[:-1], doc[:-2]])
+            with self.assertRaises(_FileSchemaError):
+                self._load()
+            self.assertEqual(self._saros.to_str(), repo._expected())
+        finally:
+            _File._use(used[0])
+            _File._use_codec(used[1])
+
+class TestCompressedStore(Test):
+    # linking works the same with compressed dump files; a big doc makes it
+    # thru, though read & inflated a chunk at a time.
+    def _assert(self):
+        store=_MemoryStore()
+        used=_File._use(_CompressedStore(store, "gz"))
+        try:
+            Test._assert(self)
+            self.assertEqual(store._names(), [])    # scratch files removed
+            doc=[("id", "JE04-1"), ("content", "i am JE04-1 " * 20000)]
+            for kind in ["gz", "bz2"]:
+                _File._use(_CompressedStore(store, kind))
+                _File(self._fname)._write(doc)
+                self.assertEqual(store._names(),
+                        [self._fname + ".xml." + kind])
+                self.assertEqual(_File(self._fname)._parse_docs(), [doc])
+                _File(self._fname)._remove()
+            with self.assertRaises(ValueError):
+                _CompressedStore(store, "xz")
+        finally:
+            _File._use(used)
+
+class TestBulkLoad(Test):
+    # a bad record in a bulk file loads no record at all.
+    def _assert(self):
+        db=_SarosDB()
+        db._bulk_dump(self._fname, ["JE00-1", "JE04-2"])
+        docs=_File(self._fname)._parse_docs()
+        docs[0]=[(i, 5 if i == "last" else j) for (i, j) in docs[0]]
+        docs[1]=[(i, 1 if i == "last" else j) for (i, j) in docs[1]]
+        _File(self._fname)._write_docs(docs)
+        with self.assertRaises(_FileDataError):
+            db._bulk_load(self._fname)
+        self.assertEqual(self._saros.to_str(), repo._orig())
+        db._bulk_dump(self._fname)
+        db._bulk_load(self._fname)
+        self.assertEqual(self._saros.to_str(), repo._orig())
+        for codec in [None, _BinaryCodec()]:  # a file of no docs loads none
+            used=_File._use_codec(codec) if codec else None
+            try:
+                db._bulk_dump(self._fname, [])
+                db._bulk_load(self._fname)
+                _File(self._fname)._remove()
+            finally:
+                if used:
+                    _File._use_codec(used)
+        self.assertEqual(self._saros.to_str(), repo._orig())
+
+##############################################################################
+
 # `TestFileLoad` deleted; else, unittest will run it.
 # `TestFileLoad` is a base class, & doesn't test anything, so no need to run it.
 # for del(TestFileLoad) trick, see /u/ Wojciech B @ https://tinyurl.com/yb58qtae
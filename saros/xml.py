@@ -1,18 +1,28 @@
 #!/usr/bin/python
 
 import os
+import thread
+import itertools
 from collections import OrderedDict
 
 from .database.schema import _Schema
+from .database.blob import _Blob
 from .error import _FileSchemaError
+from .store import _DiskStore
+from .stats import _Stats
 
 # this module contains private classes that do back-and-forth conversion between 
 # (name, value) pairs & its XML element representation -- <name>value</name>
 ################################################################################
 
+_REF = ".ref"   # suffix of element names of blobs -- see `_Blob`
+
 class _Attribute:
     # represents a (name, value) pair -- i.e., an xml attribute
+    # a `_Blob` value is written as '<name.ref>doc_id</name.ref>'.
     def __init__(self, (name, val)):
+        if isinstance(val, _Blob):
+            (name, val)=(name + _REF, val._id())
         self.__name, self.__val=(name, val)
 
     def _to_xml(self):
@@ -30,55 +40,143 @@ class _Attribute:
 
 class _Attributes:
     # represents [_Attribute]
-    def __init__(self, attrs):
+    def __init__(self, attrs, tag="xml"):
         # `attrs` = [_Attribute]
+        # `tag`: name of the enclosing element -- 'xml' or 'doc'
         self.__attrs=attrs
+        self.__tag=tag
 
     def _to_xml(self):
         # returns xml = ['<xml>', '<name>value</name>', ..., '</xml>']
         # for `join()` trick, see /u/ RiaD @ https://tinyurl.com/y8ypjowj
         elems=[each._to_xml() for each in self.__attrs]
         xml='\n'.join([''] + elems + [''])
-        return _Attribute(('xml', xml))._to_xml().split('\n')
+        return _Attribute((self.__tag, xml))._to_xml().split('\n')
 
 ################################################################################
 
-class _Element:
-    # represents an xml element -- from start-to-end tag
-    def __init__(self, element):
-        # element = "<name>value</name>"
-        self.__element=element
-
-    def _parse(self):
-        # extracts (name, val)
-        self.__validate();
-        return (self.__name(), self.__good_val())
+class _Docs:
+    # represents many docs, each a [_Attribute], held in one xml
+    def __init__(self, docs):
+        # `docs` = [[_Attribute]]
+        self.__docs=docs
 
-    def __validate(self):
-        if not ( self.__element.startswith("<") and \
-                 self.__element.endswith(">") ):
-            raise RuntimeError("invalid xml element: '" + self.__element + \
-                    "' does not begin/end with '<', '>'")
-
-    def __name(self):
-        # "<" is the first one, so we skip it & get substring from 1:
-        return self.__element[1:self.__fst_close()]
-
-    def __fst_close(self):
-        # index of first occurence of close tag symbol ">"
-        return self.__element.index(">")
+    def _to_xml(self):
+        # returns xml = ['<xml>', '<doc>', '<name>value</name>', ..., '</doc>', 
+        #                 ..., '<doc>', ..., '</doc>', '</xml>']
+        elems=[]
+        for each in self.__docs:
+            elems.extend(_Attributes(each, "doc")._to_xml())
+        xml='\n'.join([''] + elems + [''])
+        return _Attribute(('xml', xml))._to_xml().split('\n')
 
-    def __good_val(self):
-        # we extract substring after ">", so add 1 to __fst_close()
-        val=self.__element[self.__fst_close()+1:self.__snd_open()]
-        return self.__num(val)
+################################################################################
 
-    def __snd_open(self):
-        # index of second occurence of open tag symbol "<" -- which is "</"
-        return self.__element.index("</")
+class _Elements:
+    # represents a stream of xml elements, read in chunks from a file reader.
+    #
+    # NOTE:
+    # 1. xml = '<xml>' + elements + '</xml>', where elements are either all 
+    #    '<name>value</name>' or all docs -- '<doc>' + elements + '</doc>'.
+    # 2. values may span lines, & are read chunk by chunk, so memory held at 
+    #    any time is one value plus one chunk, no matter how big the file is.
+    # 3. a value ends at the first '</' after its start tag.
+    def __init__(self, reader, size=65536):
+        # `reader`: file-like object, opened for reading.
+        # `size`: # of bytes read from `reader` at a time.
+        self.__reader=reader
+        self.__size=size
+        self.__buf=""       # chunk(s) read, but not yet fully parsed
+        self.__pos=0        # position in `__buf` up to which it is parsed
+
+    def _docs(self, many=False):
+        # yields each doc in the stream as a generator of (name, val).
+        # `many`: True if stream holds many docs; '<xml></xml>' then holds 
+        # none, rather than a single doc of no elements.
+        # NOTE: a doc's generator must be used before asking for next doc; 
+        # if not, its unread elements are skipped.
+        self.__expect("xml")
+        tag=self.__tag()
+        if tag == "/xml" and many:
+            return
+        if tag != "doc":
+            attrs=self.__attrs(tag, "/xml")
+            yield attrs
+            self.__drain(attrs)
+            return
+        while tag == "doc":
+            attrs=self.__attrs(self.__tag(), "/doc")
+            yield attrs
+            self.__drain(attrs)
+            tag=self.__tag()
+        self.__check(tag, "/xml")
+
+    def __attrs(self, tag, end):
+        # yields (name, val) of elements, starting with one whose start tag is 
+        # `tag`, until tag `end` is reached.
+        while tag != end:
+            val=self.__until("</")
+            self.__check(self.__until(">"), tag)
+            yield (tag, self.__num(val))
+            tag=self.__tag()
+
+    def __drain(self, attrs):
+        # skips unread elements of `attrs` generator.
+        for _ in attrs:
+            pass
+
+    def __expect(self, tag):
+        # reads next tag, & throws if it is not `tag`.
+        self.__check(self.__tag(), tag)
+
+    def __check(self, tag, expected):
+        # throws if `tag` is not `expected`.
+        if tag != expected:
+            raise RuntimeError("invalid xml element: '<" + tag + ">' found " + \
+                    "where '<" + expected + ">' expected")
+
+    def __tag(self):
+        # reads next tag, skipping whitespace before it; returns tag name.
+        while True:
+            while self.__pos < len(self.__buf) and \
+                    self.__buf[self.__pos].isspace():
+                self.__pos+=1
+            if self.__pos < len(self.__buf) or not self.__fill():
+                break
+        if not self.__buf.startswith("<", self.__pos):
+            text=self.__buf[self.__pos:self.__pos+80]
+            raise RuntimeError("invalid xml element: '" + text + \
+                    "' does not begin with '<'")
+        self.__pos+=1
+        return self.__until(">")
+
+    def __until(self, end):
+        # returns text up to `end`, consuming both text & `end`.
+        # text is gathered in parts, so no part of it is scanned twice.
+        parts=[]
+        while True:
+            i=self.__buf.find(end, self.__pos)
+            if i >= 0:
+                parts.append(self.__buf[self.__pos:i])
+                self.__pos=i+len(end)
+                return "".join(parts)
+            # keep last few chars in buffer, as `end` may span chunks.
+            keep=max(self.__pos, len(self.__buf)-len(end)+1)
+            parts.append(self.__buf[self.__pos:keep])
+            self.__pos=keep
+            if not self.__fill():
+                raise RuntimeError("invalid xml: '" + end + "' not found")
+
+    def __fill(self):
+        # drops read part of buffer & reads next chunk into it.
+        # returns False at end of stream.
+        chunk=self.__reader.read(self.__size)
+        self.__buf=self.__buf[self.__pos:] + chunk
+        self.__pos=0
+        return chunk != ""
 
     def __num(self, val):
-        if ' ' in val: return val   # fix for bug, such as  " -4"
+        if val != val.strip(): return val   # fix for bug, such as  " -4"
         try:
             return int(val)
         except ValueError:
@@ -86,106 +184,257 @@ class _Element:
 
 ################################################################################
 
-class _Xml:
-    # represents xml content of file named `ffname`
-    def __init__(self, ffname):
-        # `ffname`: full file name = path + name + extn
-        self.__ffname=ffname
-
-    def _parse(self):
-        # parses xml file, returning document as a list of attributes.
-        # document attributes list = [(name, val), ..., (name, val)]
-        xml=[]
-        with open(self.__ffname, 'r') as reader:
-            xml=[line.rstrip() for line in reader]
-        return [_Element(i)._parse() for i in xml[1:-1]] # skip 'xml' hdr, ftr
-
-    def _schema_map(self):
-        # constrained-checked schema map of xml.
-        # map: ord dict with `_Schema` members as keys.
-        doc=self.__map(self._parse())
-        _Schema._check(doc, self)
-        return doc
-
-    def __map(self, fdoc):
-        # maps `fdoc` -- parsed xml data -- to schema.
+class _Validator:
+    # represents schema checks of docs parsed from an xml.
+    #
+    # NOTE:
+    # 1. column tables below are built from `_Schema` once, at import; each 
+    #    field of a doc is then looked up by name in O(1), so a doc is mapped 
+    #    in a single pass over its fields.
+    # 2. errors are the same, & are raised in the same order, as if columns 
+    #    were checked one by one, in schema order -- missing, duplicated, or 
+    #    of wrong type -- with non-schema columns checked last.
+    # 3. `content` may instead be given as a blob -- '<content.ref>' -- which 
+    #    maps to a `_Blob`; giving both counts as a duplicate.
+    __cols = list(_Schema)                              # columns, in order
+    __index = dict((col.name, i) for (i, col) in enumerate(__cols))
+    __refs = { _Schema.content.name + _REF: __index[_Schema.content.name] }
+
+    def __init__(self, xml):
+        # `xml`: instance of `_Xml` whose docs are checked.
+        self.__xml=xml
+
+    def _map(self, fdoc):
+        # maps `fdoc` -- (name, val) of xml elements -- to schema.
         # returns an ord dict (i.e., the map) with `_Schema` members as keys.
         # throws `_FileSchemaError` under schema violation.
-        doc=OrderedDict()
-        for col in _Schema:
-            positions=[i for i, (x, _) in enumerate(fdoc) if x==col.name]
-            if len(positions)==1:
-                doc[col]=fdoc.pop(positions[0])[1]
-            if len(positions) == 0:
-                hdr=self._hdr("schema column '"+ col.name + "' missing")
-                raise _FileSchemaError(hdr, col)
-            if len(positions) > 1:
-                hdr=self._hdr("schema column '"+ col.name + "' duplicated")
-                raise _FileSchemaError(hdr, col)
-            if type(doc[col]) != col._type:
-                typstr="data type != '" + col._type.__name__ + "'"
-                hdr=self._hdr("schema column '"+ col.name + "' " + typstr)
-                raise _FileSchemaError(hdr, col)
-            if col == list(_Schema)[-1] and len(fdoc) > 0:
-                rogues=", ".join([x for (x, _) in fdoc])
-                hdr=self._hdr("non-schema columns '" + rogues + "'")
-                raise _FileSchemaError(hdr, col)
-        return doc
+        #
+        # `vals`, `counts`: first value & # of values of each column.
+        # `rogues`: names of non-schema columns, in order of occurence in 
+        #           `fdoc`.
+        vals=[None] * len(self.__cols)
+        counts=[0] * len(self.__cols)
+        rogues=[]
+        for (name, val) in fdoc:
+            i=self.__index.get(name)
+            if i is None and name in self.__refs:
+                (i, val)=(self.__refs[name], _Blob(str(val)))
+            if i is None:
+                rogues.append(name)
+                continue
+            if counts[i] == 0:
+                vals[i]=val
+            counts[i]+=1
+        for (i, col) in enumerate(self.__cols):
+            self.__check(col, vals[i], counts[i])
+        if rogues:
+            names=", ".join(rogues)
+            self.__fail("non-schema columns '" + names + "'", self.__cols[-1])
+        return OrderedDict(zip(self.__cols, vals))
+
+    def __check(self, col, val, count):
+        # throws `_FileSchemaError` if column `col`, having `count` values, 
+        # the first of them `val`, violates schema.
+        if count == 0:
+            self.__fail("schema column '"+ col.name + "' missing", col)
+        if count > 1:
+            self.__fail("schema column '"+ col.name + "' duplicated", col)
+        if type(val) != col._type and not self.__blob(col, val):
+            typstr="data type != '" + col._type.__name__ + "'"
+            self.__fail("schema column '"+ col.name + "' " + typstr, col)
+
+    def __blob(self, col, val):
+        # True if `val` is a `_Blob` given for `content` column `col`.
+        return isinstance(val, _Blob) and col == _Schema.content
+
+    def __fail(self, errhdr, col):
+        # throws `_FileSchemaError`, headed `errhdr`, for column `col`.
+        raise _FileSchemaError(self.__xml._hdr(errhdr), col)
+
+################################################################################
+
+class _XmlCodec:
+    # represents the xml encoding of docs -- the default one of `_File`.
+    #
+    # NOTE: all codecs offer the same methods, so `_File` can use either of 
+    # them -- see also `binary` module:
+    #   -> `_extn()`                    -> file extension
+    #   -> `_write(writer, docs, many)` -> writes docs, [[(name, val)]]; 
+    #                                      returns # of bytes written
+    #   -> `_docs(reader, many)`        -> yields each doc, as (name, val)s
+    def _extn(self):
+        # file extension.
+        return ".xml"
+
+    def _write(self, writer, docs, many=True):
+        # writes `docs` -- [[(name, val)]] -- to `writer`; returns # of bytes 
+        # written.  if `many` is False, writes the one doc in `docs` as a 
+        # single doc -- its elements placed right inside <xml>.
+        # `xml` = ['<xml>', '<doc>', '<name>value</name>', ..., '</xml>'], or
+        #         ['<xml>', '<name>value</name>', ..., '</xml>']
+        if many:
+            attrs=[[_Attribute(attr) for attr in doc] for doc in docs]
+            xml=_Docs(attrs)._to_xml()
+        else:
+            xml=_Attributes([_Attribute(attr) for attr in docs[0]])._to_xml()
+        for each in xml:
+            writer.write(each)
+            writer.write("\n")
+        return sum([len(i) + 1 for i in xml])
+
+    def _docs(self, reader, many=False):
+        # yields each doc in `reader`, as a generator of (name, val).  if 
+        # `many`, `reader` holds many docs -- possibly none; if not, one doc.
+        return _Elements(reader)._docs(many)
+
+################################################################################
+
+class _Xml:
+    # represents content of file named `fname` in a store -- an xml, or 
+    # another encoding, as per `codec`.
+    def __init__(self, fname, store, codec):
+        # `fname`: file name = name + extn
+        # `store`: store holding the file -- see `store` module
+        # `codec`: encoding of the file -- see `_XmlCodec`
+        self.__fname=fname
+        self.__store=store
+        self.__codec=codec
+
+    def _parse_docs(self):
+        # parses xml file, returning all documents in it, each as a list of 
+        # attributes = [[(name, val), ..., (name, val)], ..., [...]]
+        # NOTE: a file holds either a single doc -- its elements placed right 
+        # inside <xml> -- or many docs, each enclosed in <doc> ... </doc>.
+        _Stats._count("xml.parses")
+        with _Stats._timer("xml.parse"):
+            with self.__store._reader(self.__fname) as reader:
+                return [list(each) for each in self.__codec._docs(reader)]
+
+    def _schema_maps(self, many=False):
+        # constrained-checked schema maps of all docs in xml, in file order.
+        # `many`: True if xml is known to hold many docs -- e.g., a bulk 
+        # dump -- so that it may hold none; see `_Elements._docs()`.
+        # NOTE: all docs are checked before any map is returned.
+        _Stats._count("xml.parses")
+        with _Stats._timer("xml.parse"):
+            with self.__store._reader(self.__fname) as reader:
+                check=_Validator(self)
+                fdocs=self.__codec._docs(reader, many)
+                docs=[check._map(each) for each in fdocs]
+        for doc in docs:
+            _Schema._check(doc, self)
+        return docs
 
     def _hdr(self, errhdr):
         # appends file name part to `errhdr` (i.e., error header)
-        return errhdr + " in '" + self.__ffname + "'"
+        ffname=self.__store._full_name(self.__fname)
+        return errhdr + " in '" + ffname + "'"
 
 ################################################################################
 
 class _File:
     # represents an xml file, one identified by a given name.
     # file holds a saros doc as an xml.
+    #
+    # NOTE: 
+    # 1. all `_File` instances share the same store -- see `store` module.  by 
+    #    default, it is the `temp` directory on disk; use `_use()` to switch.
+    # 2. scratch files, i.e., ones used for a single dump -> edit -> load, 
+    #    should get names from `_unique()`, so that concurrent users -- 
+    #    threads or processes -- never write to the same file.
+    # 3. all `_File` instances share the same codec, too -- by default, xml; 
+    #    use `_use_codec()` to switch to another, such as a binary one -- see 
+    #    `binary` module.  file extension comes from the codec.
+    __store = _DiskStore()
+    __codec = _XmlCodec()
+    __count = itertools.count(1)    # scratch file counter
+
     def __init__(self, name):
         # `name` is name of xml file
         # NOTE: `name` does NOT include file path and file extension
         self.__name = name
-        self.__extn = ".xml"    # xml file extension
-        self.__dir = "temp"     # directory containing the xml file
+
+    @classmethod
+    def _unique(cls, prefix):
+        # returns a file name, starting with `prefix`, unique to this call.
+        # name = prefix-<process id>-<thread id>-<count>
+        ids=[os.getpid(), thread.get_ident(), next(cls.__count)]
+        return "-".join([prefix] + [str(i) for i in ids])
+
+    @classmethod
+    def _use(cls, store):
+        # makes all `_File` instances use `store`; returns store used so far.
+        used=cls.__store
+        cls.__store=store
+        return used
+
+    @classmethod
+    def _use_codec(cls, codec):
+        # makes all `_File` instances use `codec`; returns codec used so far.
+        used=cls.__codec
+        cls.__codec=codec
+        return used
 
     def _write(self, doc):
-        # writes `doc` as an xml.  `doc` represents a document as a list of 
-        # attributes = [(name, val), ..., (name, val)]
-        # `xml` = ['<xml>', '<name>value</name>', ..., '</xml>']
-        xml=_Attributes([_Attribute(attr) for attr in doc])._to_xml()
-        with open(self.__full_name(), 'w') as writer:
-            for each in xml:
-                writer.write(each)
-                writer.write("\n")
+        # writes `doc` as a single doc.  `doc` represents a document as a list 
+        # of attributes = [(name, val), ..., (name, val)]
+        self.__write_docs([doc], False)
+
+    def _write_docs(self, docs):
+        # writes `docs` into the one file.  `docs` represents many documents, 
+        # each a list of attributes = [[(name, val), ..., (name, val)], ...]
+        self.__write_docs(docs, True)
+
+    def __write_docs(self, docs, many):
+        # writes `docs` to the file, using the codec -- see `_XmlCodec`.
+        with _Stats._timer("file.write"):
+            with self.__store._writer(self.__fname()) as writer:
+                size=self.__codec._write(writer, docs, many)
+        _Stats._count("file.writes")
+        _Stats._count("file.bytes_written", size)
 
     def __xml(self):
         # returns an instance of `_Xml`
-        return _Xml(self.__full_name())
-
-    def __full_name(self):
-        # returns full name of xml file: full path + file name + extension
-        # example: '~/../saros/saros/temp/doc.xml'
-        return self.__path() + self.__name + self.__extn
-
-    def __path(self):
-        # returns full path to the xml file.
-        # example: '~/../saros/saros/temp/'
-        return os.path.dirname(os.path.realpath(__file__)) + \
-                "/" + self.__dir + "/"
-
-    def _link(self, prev, db):
-        # link doc, represented by file's content, to previous revision `prev`
-        self._write(self.__doc(_Schema.prev.name, prev))
+        return _Xml(self.__fname(), self.__store, self.__codec)
+
+    def __fname(self):
+        # returns name of file, as known to the store: name + extension
+        # example: 'doc.xml'
+        return self.__name + self.__codec._extn()
+
+    def _link_all(self, links, db):
+        # link all docs, represented by file's content, to their previous revs.
+        # `links`: { rev: prev } -- new `prev` of each doc in file, by `rev`.
+        # all docs go to `db` in one load, so db updates `last` only once.
+        docs=self.__xml()._parse_docs()
+        self._write_docs([self.__linked(doc, links) for doc in docs])
         db._load(self.__name)
+        self._remove()
 
-    def __doc(self, name, value):
-        # returns `doc` info, i.e., `[(name, val)]`, updated with `value`.
-        doc=self.__xml()._parse()
-        return [(name, value) if i == name else (i, j) for (i, j) in doc]
-
-    def _schema_map(self):
-        # valid schema map (ord dict with schema items as keys) of contents.
-        return self.__xml()._schema_map()
+    def _upload(self, db):
+        # loads docs in file into `db`, updating `last` of upstream revs, & 
+        # then removes the file.
+        db._load(self.__name)
+        self._remove()
+
+    def _remove(self):
+        # removes the file from the store, if it is there.
+        self.__store._remove(self.__fname())
+
+    def __linked(self, doc, links):
+        # returns `doc`, i.e., `[(name, val)]`, with `prev` set from `links`.
+        rev=dict(doc)[_Schema.rev.name]
+        prev=_Schema.prev.name
+        return [(i, links[rev]) if i == prev else (i, j) for (i, j) in doc]
+
+    def _parse_docs(self):
+        # all docs in file, each as a list of attributes = [(name, val)]
+        return self.__xml()._parse_docs()
+
+    def _schema_maps(self, many=False):
+        # valid schema maps, one per doc in file, of contents.  `many`: True 
+        # if file is known to hold many docs -- possibly none.
+        return self.__xml()._schema_maps(many)
 
 ################################################################################
 